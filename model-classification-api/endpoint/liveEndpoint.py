@@ -0,0 +1,83 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.responses import StreamingResponse
+
+from live.pubsub import CLOSED, DROP_POLICIES, LIVE_DROP_POLICY, LIVE_QUEUE_SIZE, live_broker
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = 15
+
+
+def parse_devices(devices: Optional[str]):
+    """Comma separated device IDs, empty means all devices"""
+    return [d.strip() for d in devices.split(",") if d.strip()] if devices else None
+
+
+def check_options(policy: str, queue: int):
+    if policy not in DROP_POLICIES:
+        raise HTTPException(status_code=400, detail=f"policy must be one of {DROP_POLICIES}")
+    if not 1 <= queue <= 10000:
+        raise HTTPException(status_code=400, detail="queue must be between 1 and 10000")
+
+
+@router.websocket("/ws")
+async def live_websocket(websocket: WebSocket, devices: Optional[str] = None,
+                         policy: str = LIVE_DROP_POLICY, queue: int = LIVE_QUEUE_SIZE):
+    if policy not in DROP_POLICIES or not 1 <= queue <= 10000:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    subscription = live_broker.subscribe(parse_devices(devices), queue, policy)
+
+    async def receive():
+        # Only used to notice the client going away
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    async def send():
+        while True:
+            event = await subscription.get()
+            if event is CLOSED:
+                await websocket.close(code=1013)  # Try again later: client fell behind
+                return
+            await websocket.send_text(json.dumps({**event, "dropped": subscription.dropped}, default=str))
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        live_broker.unsubscribe(subscription)
+
+
+@router.get("/sse")
+async def live_sse(request: Request, devices: Optional[str] = None,
+                   policy: str = Query(LIVE_DROP_POLICY), queue: int = Query(LIVE_QUEUE_SIZE)):
+    check_options(policy, queue)
+    subscription = live_broker.subscribe(parse_devices(devices), queue, policy)
+
+    async def stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is CLOSED:
+                    return
+                payload = json.dumps({**event, "dropped": subscription.dropped}, default=str)
+                yield f"event: {event['type']}\ndata: {payload}\n\n"
+        finally:
+            live_broker.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
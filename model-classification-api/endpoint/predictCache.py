@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+# --- Cache Config ---
+PREDICT_CACHE_TTL = int(os.getenv("PREDICT_CACHE_TTL", "300"))  # seconds
+PREDICT_CACHE_MAX_SIZE = int(os.getenv("PREDICT_CACHE_MAX_SIZE", "1024"))  # entries
+
+
+class PredictionCache:
+    """Per-device result cache keyed on the latest ingested timestamp
+
+    An entry is valid while the device has no newer sensor document and the
+    TTL has not expired. Concurrent requests for the same key and version
+    share a single computation. Each entry carries the ETag of its payload.
+    """
+
+    def __init__(self, ttl: int = PREDICT_CACHE_TTL, max_size: int = PREDICT_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (version, expires_at, payload, etag)
+        self._inflight = {}  # (key, version) -> asyncio.Future
+
+    @staticmethod
+    def make_etag(payload) -> str:
+        """Strong ETag of a payload, so two different bodies never share one"""
+        body = json.dumps(payload, sort_keys=True, default=str)
+        digest = hashlib.sha1(body.encode()).hexdigest()[:20]
+        return f'"{digest}"'
+
+    @staticmethod
+    def etag_matches(if_none_match, etag: str) -> bool:
+        """Check an If-None-Match header value against an ETag"""
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+    def get(self, key, version):
+        """Return (payload, etag) of a live entry, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cached_version, expires_at, payload, etag = entry
+        if cached_version != version or expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload, etag
+
+    def put(self, key, version, payload) -> str:
+        """Store a payload and return its ETag"""
+        etag = self.make_etag(payload)
+        self._entries[key] = (version, time.monotonic() + self.ttl, payload, etag)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return etag
+
+    async def get_or_compute(self, key, version, compute):
+        """Return (payload, etag) from the cache or run compute() once for all concurrent callers
+
+        The computation runs in its own task, so a caller that disconnects only stops
+        waiting and the other callers still get the result.
+        """
+        entry = self.get(key, version)
+        if entry is not None:
+            return entry
+
+        flight = (key, version)
+        task = self._inflight.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(flight, compute))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Mark as retrieved
+            self._inflight[flight] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, flight, compute):
+        try:
+            payload = await compute()
+        finally:
+            self._inflight.pop(flight, None)
+        return payload, self.put(*flight, payload)
+
+
+prediction_cache = PredictionCache()
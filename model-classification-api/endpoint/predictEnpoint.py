@@ -1,14 +1,16 @@
 from schema.predictSchema import PredictionOutput  # Updated class name
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from typing import List
 import random
 import time
-from preprocess.preprocess import Preprocessor  # Assuming this is a function to read the pickle file
+from preprocess.preprocess import Preprocessor, SignalQualityError, compute_features, fetch_latest_timestamp
+from preprocess.scheduler import FEATURE_INTERVAL, FEATURE_SCHEDULER_ENABLED, feature_scheduler
+from endpoint.predictCache import prediction_cache
+from live.pubsub import live_broker
 from tensorflow.keras.models import load_model
 from pydantic import BaseModel
 import pandas as pd
 import numpy as np
-import neurokit2 as nk
 import json
 
 model = load_model("assets/stress_model.keras")
@@ -37,18 +39,33 @@ class InputData(BaseModel):
     type: int
 
 
+async def cached_response(kind: str, deviceId: str, request: Request, response: Response, compute):
+    """Serve a result from the prediction cache, answering 304 when the client has the cached body"""
+    latest_timestamp = await fetch_latest_timestamp(deviceId)
+    key = (kind, deviceId)
+    if_none_match = request.headers.get("if-none-match")
+
+    entry = prediction_cache.get(key, latest_timestamp)
+    if entry is not None and prediction_cache.etag_matches(if_none_match, entry[1]):
+        return Response(status_code=304, headers={"ETag": entry[1], "Cache-Control": "no-cache"})
+
+    result, etag = await prediction_cache.get_or_compute(key, latest_timestamp, compute)
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return result
+
+
 @router.get("/{deviceId}", response_model=PredictionOutput)  # Change to "/" since prefix is added in main.py
-async def predict(deviceId: str):
+async def predict(deviceId: str, request: Request, response: Response):
+    return await cached_response("predict", deviceId, request, response, lambda: run_predict(deviceId))
 
+
+async def run_predict(deviceId: str):
     randomHeartRate = random.randint(60, 100)  # Simulate heart rate
     randomHeartRate = round(randomHeartRate)
 
     randomStressPrediction = random.choice(["normal", "low", "medium", "high"])
     timestamp = int(time.time())  # Get current timestamp
 
-    data = preprocess.read_pkl()  # Assuming this function reads the pickle file and returns the data
-    print(data)
-
     jsonData = {
         "deviceId": deviceId,
         "stressPrediction": randomStressPrediction,
@@ -56,6 +73,7 @@ async def predict(deviceId: str):
         "timeStamp": timestamp
     }
 
+    live_broker.publish("prediction", deviceId, jsonData, timestamp)
     return jsonData
 
 @router.post("/")
@@ -72,64 +90,39 @@ def predict_stress(data: InputData):
     return {"predicted_stress": predicted_class}
 
 @router.get("/test/{deviceId}")
-async def test_predict(deviceId: str):
-    # Create an instance with the deviceId
-    processor = Preprocessor(deviceId)
-    # Then call the method on that instance
-    data = await processor.fetch_recent_data()
+async def test_predict(deviceId: str, request: Request, response: Response):
+    return await cached_response("test", deviceId, request, response, lambda: run_test_predict(deviceId))
 
-    merged_data = {
-        "deviceId": deviceId,
-        "eda": [],
-        "ppg": [],
-        "timestamps": []
-    }
 
-    for doc in data:
-        if 'sensors' in doc and 'eda' in doc['sensors']:
-            merged_data['eda'].extend(doc['sensors']['eda'])
-        
-        if 'sensors' in doc and 'ppg' in doc['sensors']:
-            merged_data['ppg'].extend(doc['sensors']['ppg'])
-            
-        if 'timestamp' in doc:
-            merged_data['timestamps'].append(doc['timestamp'])
-    
-    if merged_data['ppg']:
-        print(f"PPG data sample (first 10 values): {merged_data['ppg'][:10]}")
-
-    ppg = merged_data['ppg']
-    eda = merged_data['eda']
-
-    ppg_signals, _ = nk.ppg_process(ppg, sampling_rate=100, heart_rate=True)
-    print(f"PPG signals: {ppg_signals}")
-
-    eda_signals, _ = nk.eda_process(eda, sampling_rate=15)
-    print(f"EDA signals: {eda_signals}")
-
-    ppg_peak = ppg_signals['PPG_Peaks']
-    hrv_indices = nk.hrv(ppg_peak, sampling_rate=100)
-    print(f"HRV indices: {hrv_indices}")
+async def run_test_predict(deviceId: str):
+    # Create an instance with the deviceId
+    processor = Preprocessor(deviceId)
 
-      # Merge the dataframes
-    resampled_ppg = ppg_signals.tail(100)
-    resampled_ppg = resampled_ppg.mean()
-    
-    resampled_eda = eda_signals.tail(15)
-    resampled_eda = resampled_eda.mean()
-    print(f"PPG signals after resampling: {resampled_ppg}")
-    print(f"EDA signals after resampling: {resampled_eda}")
+    # Serve the scheduler's result while it is still fresh
+    if FEATURE_SCHEDULER_ENABLED:
+        precomputed = await processor.fetch_latest_features(max_age=2 * FEATURE_INTERVAL)
+        if precomputed:
+            return json.loads(json.dumps({
+                "status": "success",
+                "data": precomputed,
+                "source": "precomputed"
+            }, default=str))
 
-    # Pack the data into a JSON-serializable format
-    processed_data = {
-        "deviceId": deviceId,
-        "eda_features": {k: None if pd.isna(v) else v for k, v in resampled_eda.to_dict().items()},
-        "ppg_features": {k: None if pd.isna(v) else v for k, v in resampled_ppg.to_dict().items()},
-        "hrv_indices": {k: None if pd.isna(v) else v for k, v in (hrv_indices.iloc[0].to_dict() if not hrv_indices.empty else {}).items()},
-        "timestamp": int(time.time())
-    }
+    # Then call the method on that instance
+    data = await processor.fetch_recent_data()
 
+    try:
+        # neurokit2 takes seconds, keep it off the event loop
+        processed_data = await feature_scheduler.run_in_pool(compute_features, deviceId, data)
+    except SignalQualityError as e:
+        return {
+            "status": "rejected",
+            "deviceId": deviceId,
+            "reason": e.reason,
+            "quality": e.metrics
+        }
     print(f"Processed data: {processed_data}")
+    live_broker.publish("features", deviceId, processed_data, processed_data["timestamp"])
 
     try:
         db_result = await processor.save_preprocessed_data(processed_data)
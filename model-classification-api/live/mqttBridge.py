@@ -0,0 +1,112 @@
+import json
+import os
+import zlib
+
+import paho.mqtt.client as mqtt
+import zstandard
+
+from live.pubsub import live_broker
+
+# --- MQTT Config (same broker as mqttSubcriber) ---
+MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "broker.emqx.io")
+MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", "1883"))
+LIVE_TOPIC_PREFIX = os.getenv("LIVE_TOPIC_PREFIX", "EmotibitLive")
+# Opt-in like the subscriber side: anyone on a public broker can publish to the live topics
+LIVE_EVENTS_ENABLED = os.getenv("LIVE_EVENTS_ENABLED", "false").lower() == "true"
+
+# Event types the subscriber publishes; anything else on the topic is ignored.
+# Predictions are produced by this API and never accepted from the broker.
+BRIDGE_EVENT_TYPES = ("reading", "status", "features")
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZLIB_HEADERS = (b"\x78\x01", b"\x78\x5e", b"\x78\x9c", b"\x78\xda")
+MAX_EVENT_SIZE = 1 << 20  # Largest decompressed event accepted
+
+
+def decode_event(raw: bytes) -> dict:
+    """Decode a live event published as JSON, zlib- or zstd-compressed JSON"""
+    if raw[:4] == ZSTD_MAGIC:
+        raw = _zstd_decompress(raw)
+    elif raw[:2] in ZLIB_HEADERS:
+        raw = _zlib_decompress(raw)
+    return json.loads(raw)
+
+
+def _zlib_decompress(raw: bytes) -> bytes:
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(raw, MAX_EVENT_SIZE)
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"Live event exceeds {MAX_EVENT_SIZE} bytes")
+    if not decompressor.eof:
+        raise ValueError("Truncated zlib live event")
+    return data
+
+
+def _zstd_decompress(raw: bytes) -> bytes:
+    # The declared content size is checked first; frames without one are read through a capped stream
+    if zstandard.frame_content_size(raw) > MAX_EVENT_SIZE:
+        raise ValueError(f"Live event exceeds {MAX_EVENT_SIZE} bytes")
+    chunks, size = [], 0
+    with zstandard.ZstdDecompressor().stream_reader(raw) as reader:
+        while size <= MAX_EVENT_SIZE:
+            chunk = reader.read(MAX_EVENT_SIZE + 1 - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+    if size > MAX_EVENT_SIZE:
+        raise ValueError(f"Live event exceeds {MAX_EVENT_SIZE} bytes")
+    return b"".join(chunks)
+
+
+class MQTTBridge:
+    """Forwards the subscriber's live events (<prefix>/<deviceId>/<type>) into the in-process broker"""
+
+    def __init__(self, broker=live_broker, host: str = MQTT_BROKER_HOST, port: int = MQTT_BROKER_PORT,
+                 prefix: str = LIVE_TOPIC_PREFIX):
+        self.broker = broker
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+
+    def start(self) -> bool:
+        try:
+            self.client.connect_async(self.host, self.port, 60)
+            self.client.loop_start()
+            return True
+        except Exception as e:
+            print(f"❌ Live bridge could not connect to {self.host}: {e}")
+            return False
+
+    def stop(self) -> None:
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(f"{self.prefix}/#")
+            print(f"✅ Live bridge subscribed to {self.prefix}/#")
+        else:
+            print(f"❌ Live bridge failed to connect, return code: {rc}")
+
+    def _on_message(self, client, userdata, msg):
+        # Runs on the paho network thread
+        try:
+            parts = msg.topic.split("/")
+            if len(parts) != 3:
+                return
+            _, device_id, event_type = parts
+            if event_type not in BRIDGE_EVENT_TYPES:
+                return
+            event = decode_event(msg.payload)
+            if not isinstance(event, dict) or not isinstance(event.get("data"), dict):
+                return
+            self.broker.publish_threadsafe(event_type, device_id, event.get("data"), event.get("timestamp"))
+        except Exception as e:
+            print(f"❌ Invalid live event on {msg.topic}: {e}")
+
+
+mqtt_bridge = MQTTBridge()
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+
+# --- Live Stream Config ---
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))  # events buffered per client
+LIVE_DROP_POLICY = os.getenv("LIVE_DROP_POLICY", "drop_oldest")
+
+# What happens when a client's queue is full:
+#   drop_oldest  discard the oldest queued event (client always sees the newest data)
+#   drop_newest  discard the incoming event
+#   disconnect   close the client's stream
+DROP_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+# Event types whose latest value is replayed to new subscribers
+SNAPSHOT_TYPES = ("status", "prediction")
+
+CLOSED = object()  # Queued to tell a consumer its subscription was closed
+
+
+class Subscription:
+    """One client's bounded event queue"""
+
+    def __init__(self, device_ids=None, max_queue: int = LIVE_QUEUE_SIZE, policy: str = LIVE_DROP_POLICY):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.device_ids = set(device_ids) if device_ids else None  # None means all devices
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.closed = False
+
+    def wants(self, event: dict) -> bool:
+        return self.device_ids is None or event.get("deviceId") in self.device_ids
+
+    def offer(self, event: dict) -> None:
+        """Queue an event without blocking, applying the drop policy when full"""
+        if self.closed:
+            return
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+            return
+
+        self.dropped += 1
+        if self.policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(event)
+        elif self.policy == "disconnect":
+            self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        # Make room for the sentinel so the consumer wakes up
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(CLOSED)
+
+    async def get(self):
+        """Wait for the next event, returns CLOSED when the subscription ends"""
+        return await self.queue.get()
+
+
+class LiveBroker:
+    """In-process pub/sub for readings, liveness changes and predictions
+
+    publish() must run on the event loop; other threads use publish_threadsafe().
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.snapshot = {}  # (type, deviceId) -> latest event
+        self.loop = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    def subscribe(self, device_ids=None, max_queue: int = LIVE_QUEUE_SIZE,
+                  policy: str = LIVE_DROP_POLICY) -> Subscription:
+        subscription = Subscription(device_ids, max_queue, policy)
+        for event in self.snapshot.values():
+            if subscription.wants(event):
+                subscription.offer(event)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscriptions.discard(subscription)
+        subscription.close()
+
+    def publish(self, event_type: str, device_id: str, data, timestamp=None) -> None:
+        event = {
+            "type": event_type,
+            "deviceId": device_id,
+            "data": data,
+            "timestamp": timestamp or int(time.time())
+        }
+        if event_type in SNAPSHOT_TYPES:
+            self.snapshot[(event_type, device_id)] = event
+
+        for subscription in list(self.subscriptions):
+            if subscription.wants(event):
+                subscription.offer(event)
+            if subscription.closed:
+                self.subscriptions.discard(subscription)
+
+    def publish_threadsafe(self, event_type: str, device_id: str, data, timestamp=None) -> None:
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.publish, event_type, device_id, data, timestamp)
+
+
+live_broker = LiveBroker()
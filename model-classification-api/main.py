@@ -1,11 +1,37 @@
 from fastapi import FastAPI
+import asyncio
 from endpoint.predictEnpoint import router as predictRouter
+from endpoint.liveEndpoint import router as liveRouter
 from config.cors import add_cors_middleware
+from preprocess.scheduler import feature_scheduler, FEATURE_SCHEDULER_ENABLED
+from live.pubsub import live_broker
+from live.mqttBridge import mqtt_bridge, LIVE_EVENTS_ENABLED
 
 app = FastAPI()
 app.include_router(predictRouter, prefix="/predict", tags=["predict"])  # Add prefix here
+app.include_router(liveRouter, prefix="/live", tags=["live"])
 add_cors_middleware(app) 
 
+@app.on_event("startup")
+async def start_feature_scheduler():
+    if FEATURE_SCHEDULER_ENABLED:
+        feature_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_feature_scheduler():
+    await feature_scheduler.stop()
+
+@app.on_event("startup")
+async def start_live_stream():
+    live_broker.bind(asyncio.get_running_loop())
+    if LIVE_EVENTS_ENABLED:
+        mqtt_bridge.start()
+
+@app.on_event("shutdown")
+async def stop_live_stream():
+    if LIVE_EVENTS_ENABLED:
+        mqtt_bridge.stop()
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
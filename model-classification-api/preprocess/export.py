@@ -0,0 +1,174 @@
+# Streaming export of raw sensor windows to Parquet for model training
+#
+# Usage:
+#   python -m preprocess.export --start 2025-05-01 --end 2025-05-08 --out exports/ \
+#       --devices Emotibit-001 MD-V5-0000560
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config.mongo import create_mongo_client, get_database
+
+CHANNELS = ("eda", "ppg")
+CURSOR_BATCH_SIZE = 500
+ROWS_PER_BATCH = 200_000
+
+SAMPLE_SCHEMA = pa.schema([
+    ("device_id", pa.dictionary(pa.int32(), pa.string())),
+    ("timestamp", pa.float64()),
+    ("value", pa.float64()),
+])
+
+
+class ChannelWriter:
+    """Accumulates flattened samples of one channel and writes them in fixed size record batches"""
+
+    def __init__(self, path: Path, device_id: str, rows_per_batch: int = ROWS_PER_BATCH):
+        self.path = path
+        self.device_id = device_id
+        self.rows_per_batch = rows_per_batch
+        self.samples = 0
+        self._timestamps = []
+        self._values = []
+        self._buffered = 0
+        self._writer = None
+
+    def add(self, timestamp: int, values) -> None:
+        n = len(values)
+        if n == 0:
+            return
+        # Packets carry one second of samples, spread them evenly across that second
+        self._timestamps.append(timestamp + np.arange(n, dtype=np.float64) / n)
+        self._values.append(np.asarray(values, dtype=np.float64))
+        self._buffered += n
+        if self._buffered >= self.rows_per_batch:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffered:
+            return
+        timestamps = np.concatenate(self._timestamps)
+        values = np.concatenate(self._values)
+        device = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(len(values), dtype=np.int32)), pa.array([self.device_id])
+        )
+        batch = pa.record_batch([device, pa.array(timestamps), pa.array(values)], schema=SAMPLE_SCHEMA)
+
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, SAMPLE_SCHEMA, compression="zstd")
+        self._writer.write_batch(batch)
+
+        self.samples += len(values)
+        self._timestamps, self._values, self._buffered = [], [], 0
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def export_device(device_id: str, start: int, end: int, out_dir: str,
+                  mongo_uri: str = None, rows_per_batch: int = ROWS_PER_BATCH) -> dict:
+    """Stream one device's readings in [start, end) into one Parquet file per channel"""
+    # Each worker process needs its own client, MongoClient is not fork-safe
+    client = create_mongo_client(mongo_uri)
+    writers = {
+        channel: ChannelWriter(Path(out_dir) / channel / f"{device_id}.parquet", device_id, rows_per_batch)
+        for channel in CHANNELS
+    }
+    documents = 0
+    try:
+        cursor = get_database(client, analytics=True)["sensor_readings"].find(
+            {"device_id": device_id, "timestamp": {"$gte": start, "$lt": end}},
+            {"_id": 0, "timestamp": 1, "sensors.eda": 1, "sensors.ppg": 1},
+        ).sort("timestamp", 1).batch_size(CURSOR_BATCH_SIZE)
+
+        for doc in cursor:
+            sensors = doc.get("sensors") or {}
+            for channel, writer in writers.items():
+                values = sensors.get(channel)
+                if values:
+                    writer.add(doc["timestamp"], values)
+            documents += 1
+    finally:
+        for writer in writers.values():
+            writer.close()
+        client.close()
+
+    return {
+        "device_id": device_id,
+        "documents": documents,
+        **{f"{channel}_samples": writer.samples for channel, writer in writers.items()},
+    }
+
+
+def list_devices(start: int, end: int, mongo_uri: str = None) -> list:
+    client = create_mongo_client(mongo_uri)
+    try:
+        return get_database(client, analytics=True)["sensor_readings"].distinct(
+            "device_id", {"timestamp": {"$gte": start, "$lt": end}}
+        )
+    finally:
+        client.close()
+
+
+def export_windows(device_ids, start: int, end: int, out_dir: str, workers: int = None) -> list:
+    """Export several devices in parallel, one worker process per device"""
+    workers = workers or min(len(device_ids), os.cpu_count() or 1)
+    started = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(export_device, device_id, start, end, out_dir): device_id
+            for device_id in device_ids
+        }
+        for future in as_completed(futures):
+            device_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"❌ Export failed for device {device_id}: {e}")
+                continue
+            samples = sum(result[f"{channel}_samples"] for channel in CHANNELS)
+            print(f"✅ {device_id}: {result['documents']} documents, {samples} samples")
+            results.append(result)
+
+    elapsed = time.perf_counter() - started
+    total = sum(r[f"{channel}_samples"] for r in results for channel in CHANNELS)
+    print(f"Exported {total} samples from {len(results)} device(s) in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:,.0f} samples/s)")
+    return results
+
+
+def parse_time(value: str) -> int:
+    """Accept a unix timestamp or an ISO date/datetime"""
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export sensor windows to Parquet for training")
+    parser.add_argument("--start", required=True, help="Unix timestamp or ISO date (inclusive)")
+    parser.add_argument("--end", default=str(int(time.time())), help="Unix timestamp or ISO date (exclusive)")
+    parser.add_argument("--devices", nargs="*", help="Device IDs (default: all devices in range)")
+    parser.add_argument("--out", default="exports", help="Output directory")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    devices = args.devices or list_devices(start, end)
+    if not devices:
+        print("⚠️ No devices found in the requested range.")
+    else:
+        export_windows(devices, start, end, args.out, args.workers)
@@ -0,0 +1,371 @@
+# Vectorized HRV kernel: computes only the HRV indices the stress model uses
+# (see InputData) instead of the full nk.hrv set, for many devices in one call
+#
+# Follows neurokit2's definitions so results can be swapped in for nk.hrv. Validate
+# against neurokit2 on exported data (preprocess.export) or on simulated windows:
+#   python -m preprocess.hrv --exports exports/ --window 360
+#   python -m preprocess.hrv --simulate 20
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import interp1d
+from scipy.signal import welch
+
+HRV_INDICES = (
+    "HRV_MeanNN", "HRV_SDNN", "HRV_RMSSD", "HRV_LF", "HRV_HF", "HRV_LFHF",
+    "HRV_SD1", "HRV_SD2", "HRV_SD1SD2", "HRV_DFA_alpha1", "HRV_SampEn", "HRV_ApEn",
+)
+
+LF_BAND = (0.04, 0.15)  # Hz
+HF_BAND = (0.15, 0.4)  # Hz
+MAX_FREQUENCY = 0.5  # Hz, upper edge of neurokit2's VHF band
+INTERPOLATION_RATE = 100  # Hz, neurokit2's default resampling rate of the RR series
+DFA_SCALES = np.arange(4, 12)  # beats, neurokit2's short-term window (alpha1)
+DFA_MIN_INTERVALS = 12
+ENTROPY_DIMENSION = 2
+ENTROPY_TOLERANCE = 0.2  # times the SD of the RR series
+MATCH_CHUNK = 4096  # templates per candidate search, bounds memory
+
+
+def rri_from_peaks(peaks, sampling_rate: int):
+    """RR intervals in ms from peak indices or a 0/1 peak column (e.g. PPG_Peaks)"""
+    peaks = np.asarray(peaks)
+    if peaks.size and np.isin(peaks, (0, 1)).all() and peaks.size > 2:
+        peaks = np.flatnonzero(peaks == 1)
+    return np.diff(peaks) / sampling_rate * 1000
+
+
+def _segments(lengths):
+    """Segment id and start offset of every element of the concatenated series"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.repeat(np.arange(len(lengths)), lengths), starts
+
+
+def _segment_std(values, seg, count, devices):
+    """Sample standard deviation (ddof=1) of every segment, NaN below two values"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(seg, values, minlength=devices) / count
+        squares = np.bincount(seg, (values - mean[seg]) ** 2, minlength=devices)
+        return np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+
+
+def _time_and_poincare(x, seg, lengths, devices):
+    """MeanNN, SDNN, RMSSD, SD1, SD2 for all devices with segmented reductions"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(seg, x, minlength=devices) / lengths
+        sdnn = _segment_std(x, seg, lengths, devices)
+
+        # Successive pairs that do not cross a device boundary
+        same = seg[1:] == seg[:-1]
+        rr_n, rr_plus, pair_seg = x[:-1][same], x[1:][same], seg[1:][same]
+        pairs = np.bincount(pair_seg, minlength=devices).astype(np.float64)
+
+        diff = rr_plus - rr_n
+        rmssd = np.sqrt(np.bincount(pair_seg, diff ** 2, minlength=devices) / pairs)
+        sd1 = _segment_std((rr_n - rr_plus) / np.sqrt(2), pair_seg, pairs, devices)
+        sd2 = _segment_std((rr_n + rr_plus) / np.sqrt(2), pair_seg, pairs, devices)
+        ratio = sd1 / sd2
+
+    return {
+        "HRV_MeanNN": mean,
+        "HRV_SDNN": sdnn,
+        "HRV_RMSSD": rmssd,
+        "HRV_SD1": sd1,
+        "HRV_SD2": sd2,
+        "HRV_SD1SD2": ratio,
+    }
+
+
+def _frequency(rri):
+    """Normalized LF and HF power of one RR series (Welch on the resampled series)
+
+    Mirrors nk.hrv_frequency: quadratic interpolation at 100 Hz, Welch with a window of
+    half the series and a Hann taper, trapezoidal band integration. This is the one index
+    family that cannot be batched, each device has its own resampled length.
+    """
+    if len(rri) < 4:
+        return np.nan, np.nan
+    t = np.cumsum(rri / 1000)
+    t_new = np.arange(t[0], t[-1] + 1 / INTERPOLATION_RATE, 1 / INTERPOLATION_RATE)
+    resampled = interp1d(t, rri, kind="quadratic", bounds_error=False,
+                         fill_value=([rri[0]], [rri[-1]]))(t_new)
+
+    # Same float expressions as nk.signal_psd, so the segment length matches exactly
+    n = len(resampled)
+    min_frequency = (2 * INTERPOLATION_RATE) / (n / 2)
+    nperseg = min(int((2 / min_frequency) * INTERPOLATION_RATE), int(n / 2))
+    if nperseg < 2:
+        return np.nan, np.nan
+    frequency, power = welch(resampled - resampled.mean(), fs=INTERPOLATION_RATE, scaling="density",
+                             detrend=False, nfft=2 * nperseg, average="mean", nperseg=nperseg,
+                             window="hann")
+    power = power / power.max()
+
+    keep = (frequency >= min_frequency) & (frequency <= MAX_FREQUENCY)
+    frequency, power = frequency[keep], power[keep]
+
+    def band_power(band):
+        where = (frequency >= band[0]) & (frequency < band[1])
+        return np.trapezoid(power[where], frequency[where]) if where.any() else 0.0
+
+    return band_power(LF_BAND), band_power(HF_BAND)
+
+
+def _dfa_alpha1(x, seg, starts, lengths, devices):
+    """Short-term DFA exponent for all devices, batched per scale
+
+    Overlapping windows (half a window apart) of the integrated series are linearly
+    detrended in closed form, as in nk.fractal_dfa.
+    """
+    centered = x - (np.bincount(seg, x, minlength=devices) / np.maximum(lengths, 1))[seg]
+    integrated = np.cumsum(centered)
+    # Restart the running sum at every device boundary
+    integrated -= np.concatenate(([0.0], integrated))[starts][seg]
+
+    eligible = lengths >= DFA_MIN_INTERVALS
+    fluctuations = np.full((devices, len(DFA_SCALES)), np.nan)
+
+    for k, scale in enumerate(DFA_SCALES):
+        step = scale // 2
+        counts = np.where(eligible, np.maximum(0, -(-(lengths - scale) // step)), 0)
+        if not counts.any():
+            continue
+        window_seg = np.repeat(np.arange(devices), counts)
+        first = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        window_start = starts[window_seg] + first * step
+
+        windows = integrated[window_start[:, None] + np.arange(scale)]
+        ramp = np.arange(scale) - (scale - 1) / 2
+        windows = windows - windows.mean(axis=1, keepdims=True)
+        slope = windows @ ramp / (ramp @ ramp)
+        residual = ((windows - slope[:, None] * ramp) ** 2).mean(axis=1)
+
+        valid = residual > 1e-08
+        total = np.bincount(window_seg[valid], residual[valid], minlength=devices)
+        used = np.bincount(window_seg[valid], minlength=devices)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fluctuations[:, k] = np.sqrt(total / used)
+
+    log_scale = np.log2(DFA_SCALES) - np.log2(DFA_SCALES).mean()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_fluctuation = np.log2(fluctuations)
+        log_fluctuation -= log_fluctuation.mean(axis=1, keepdims=True)
+    return log_fluctuation @ log_scale / (log_scale @ log_scale)
+
+
+def _match_counts(x, template_start, template_seg, tolerance, dimension):
+    """Number of templates within `tolerance` (Chebyshev) of each template, itself included
+
+    Templates are sorted on their first value so candidates come from a binary search
+    instead of an all-pairs comparison; only those candidates are checked on the
+    remaining coordinates. Devices are kept apart by shifting each onto its own range.
+    """
+    first = x[template_start]
+    r = tolerance[template_seg]
+
+    # Lay the devices out one after another on the number line
+    devices = len(tolerance)
+    low = np.full(devices, np.inf)
+    high = np.full(devices, -np.inf)
+    np.minimum.at(low, template_seg, first)
+    np.maximum.at(high, template_seg, first)
+    span = np.where(np.isfinite(low), high - low, 0) + 4 * np.nan_to_num(tolerance) + 1
+    offset = np.concatenate(([0.0], np.cumsum(span)[:-1])) - np.where(np.isfinite(low), low, 0)
+    key = first + offset[template_seg]
+
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    margin = r * (1 + 1e-9) + 1e-9
+
+    counts = np.zeros(len(template_start), dtype=np.int64)
+    for chunk in range(0, len(template_start), MATCH_CHUNK):
+        query = np.arange(chunk, min(chunk + MATCH_CHUNK, len(template_start)))
+        lo = np.searchsorted(sorted_key, key[query] - margin[query], side="left")
+        hi = np.searchsorted(sorted_key, key[query] + margin[query], side="right")
+        width = hi - lo
+        i = np.repeat(query, width)
+        j = order[np.repeat(lo - np.cumsum(width) + width, width) + np.arange(width.sum())]
+
+        match = np.ones(len(i), dtype=bool)
+        for k in range(dimension):
+            match &= np.abs(x[template_start[i] + k] - x[template_start[j] + k]) <= r[i]
+        counts[chunk:chunk + len(query)] = np.bincount(i[match] - chunk, minlength=len(query))
+    return counts
+
+
+def _templates(starts, lengths, dimension, drop_last=False):
+    """Start index and device of every embedded vector of the given dimension"""
+    counts = np.maximum(lengths - dimension + 1 - int(drop_last), 0)
+    template_seg = np.repeat(np.arange(len(lengths)), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return starts[template_seg] + within, template_seg, counts
+
+
+def _entropy(x, seg, starts, lengths, devices):
+    """Sample entropy and approximate entropy (m=2, r=0.2 SD) for all devices"""
+    tolerance = ENTROPY_TOLERANCE * _segment_std(x, seg, lengths.astype(np.float64), devices)
+    m = ENTROPY_DIMENSION
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # SampEn: self-matches excluded, the last m-vector dropped so both sets have n-m vectors
+        start, tseg, n_b = _templates(starts, lengths, m, drop_last=True)
+        b = np.bincount(tseg, _match_counts(x, start, tseg, tolerance, m) - 1, minlength=devices)
+        start, seg_a, n_a = _templates(starts, lengths, m + 1)
+        count_a = _match_counts(x, start, seg_a, tolerance, m + 1)
+        a = np.bincount(seg_a, count_a - 1, minlength=devices)
+        phi_b, phi_a = b / (n_b * (n_b - 1)), a / (n_a * (n_a - 1))
+        sampen = np.where(np.isclose(phi_b, 0), -np.inf,
+                          np.where(np.isclose(phi_a / phi_b, 0), np.inf, -np.log(phi_a / phi_b)))
+
+        # ApEn: self-matches included, all vectors of both dimensions (the m+1 counts are reused)
+        start, tseg, n_m = _templates(starts, lengths, m)
+        count_m = _match_counts(x, start, tseg, tolerance, m)
+        phi_m = np.bincount(tseg, np.log(count_m / n_m[tseg]), minlength=devices) / n_m
+        phi_m1 = np.bincount(seg_a, np.log(count_a / n_a[seg_a]), minlength=devices) / n_a
+        apen = np.abs(phi_m - phi_m1)
+
+    too_short = lengths < m + 3
+    sampen[too_short] = np.nan
+    apen[too_short] = np.nan
+    return sampen, apen
+
+
+def hrv_indices_batch(rri_list):
+    """Compute the model's HRV indices for many RR series at once
+
+    Args:
+        rri_list (list): One array of RR intervals in ms per device
+
+    Returns:
+        list: One dict per series, keyed like nk.hrv columns (HRV_SDNN, ...), NaN when
+        a series is too short for an index
+    """
+    devices = len(rri_list)
+    if devices == 0:
+        return []
+    series = [np.asarray(rri, dtype=np.float64) for rri in rri_list]
+    series = [rri[np.isfinite(rri)] for rri in series]
+    lengths = np.array([len(rri) for rri in series], dtype=np.int64)
+    x = np.concatenate(series) if lengths.sum() else np.zeros(0)
+    seg, starts = _segments(lengths)
+
+    indices = _time_and_poincare(x, seg, lengths.astype(np.float64), devices)
+    indices["HRV_DFA_alpha1"] = _dfa_alpha1(x, seg, starts, lengths, devices)
+    indices["HRV_SampEn"], indices["HRV_ApEn"] = _entropy(x, seg, starts, lengths, devices)
+
+    # The spectrum needs an interpolated series per device, so it stays a loop
+    lf, hf = np.array([_frequency(rri) for rri in series]).T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        indices["HRV_LF"], indices["HRV_HF"], indices["HRV_LFHF"] = lf, hf, lf / hf
+
+    return [{name: float(indices[name][d]) for name in HRV_INDICES} for d in range(devices)]
+
+
+def hrv_indices(peaks, sampling_rate: int):
+    """HRV indices of a single device from its peaks, see hrv_indices_batch"""
+    return hrv_indices_batch([rri_from_peaks(peaks, sampling_rate)])[0]
+
+
+# --- Validation against neurokit2 ---
+def load_export_windows(exports_dir: str, window_seconds: int, devices=None):
+    """Cut the PPG exports (preprocess.export) into consecutive windows of samples"""
+    import pyarrow.parquet as pq
+
+    windows = []
+    for path in sorted(Path(exports_dir, "ppg").glob("*.parquet")):
+        if devices and path.stem not in devices:
+            continue
+        table = pq.read_table(path, columns=["timestamp", "value"])
+        timestamps = table.column("timestamp").to_numpy()
+        values = table.column("value").to_numpy()
+        window_id = ((timestamps - timestamps[0]) // window_seconds).astype(np.int64)
+        bounds = np.flatnonzero(np.diff(window_id)) + 1
+        for chunk in np.split(values, bounds):
+            # Partial windows (gaps, the tail of the export) would only add noise
+            if len(chunk) >= 0.9 * window_seconds * 100:
+                windows.append((path.stem, chunk))
+    return windows
+
+
+def simulate_windows(count: int, window_seconds: int):
+    import neurokit2 as nk
+
+    rng = np.random.default_rng(0)
+    return [
+        (f"sim-{i}", nk.ppg_simulate(duration=window_seconds, sampling_rate=100,
+                                     heart_rate=rng.uniform(55, 110), random_state=i))
+        for i in range(count)
+    ]
+
+
+def validate(windows, sampling_rate: int = 100, tolerance: float = 1e-6) -> bool:
+    """Compare the kernel with nk.hrv on the same peaks, print differences and timings"""
+    import warnings
+    import neurokit2 as nk
+
+    peaks = []
+    for name, ppg in windows:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                signals, _ = nk.ppg_process(ppg, sampling_rate=sampling_rate)
+        except Exception as e:
+            print(f"⚠️ Skipped window of {name}: {e}")
+            continue
+        peaks.append(signals["PPG_Peaks"].values)
+    if not peaks:
+        print("⚠️ No usable windows.")
+        return False
+
+    started = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        reference = pd.concat([nk.hrv(p, sampling_rate=sampling_rate) for p in peaks], ignore_index=True)
+    neurokit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    kernel = pd.DataFrame(hrv_indices_batch([rri_from_peaks(p, sampling_rate) for p in peaks]))
+    kernel_seconds = time.perf_counter() - started
+
+    ok = True
+    print(f"{'index':<16}{'max abs diff':>14}{'max rel diff':>14}")
+    for name in HRV_INDICES:
+        expected = reference[name].to_numpy(dtype=np.float64)
+        actual = kernel[name].to_numpy(dtype=np.float64)
+        both = np.isfinite(expected) & np.isfinite(actual)
+        mismatch = (np.isfinite(expected) != np.isfinite(actual)).sum()
+        diff = np.abs(expected[both] - actual[both])
+        rel = diff / np.maximum(np.abs(expected[both]), 1e-12)
+        max_diff = diff.max() if diff.size else 0.0
+        max_rel = rel.max() if rel.size else 0.0
+        flag = "✅" if max_rel <= tolerance and not mismatch else "❌"
+        ok &= flag == "✅"
+        print(f"{name:<16}{max_diff:>14.3g}{max_rel:>14.3g} {flag}"
+              + (f" ({mismatch} NaN mismatches)" if mismatch else ""))
+
+    print(f"{len(peaks)} window(s): neurokit2 {neurokit_seconds:.2f}s, kernel {kernel_seconds:.3f}s "
+          f"({neurokit_seconds / kernel_seconds if kernel_seconds else 0:,.0f}x)")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate the HRV kernel against neurokit2")
+    parser.add_argument("--exports", help="Output directory of preprocess.export")
+    parser.add_argument("--devices", nargs="*", help="Device IDs (default: all exported devices)")
+    parser.add_argument("--simulate", type=int, default=0, help="Use N simulated windows instead")
+    parser.add_argument("--window", type=int, default=360, help="Window length in seconds")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="Allowed relative difference")
+    args = parser.parse_args()
+
+    if args.simulate:
+        windows = simulate_windows(args.simulate, args.window)
+    elif args.exports:
+        windows = load_export_windows(args.exports, args.window, args.devices)
+    else:
+        parser.error("either --exports or --simulate is required")
+
+    raise SystemExit(0 if validate(windows, tolerance=args.tolerance) else 1)
@@ -0,0 +1,128 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from preprocess.preprocess import (
+    SignalQualityError,
+    compute_features_batch,
+    fetch_active_devices,
+    fetch_device_windows,
+    save_preprocessed_batch,
+)
+from live.pubsub import live_broker
+
+# --- Scheduler Config ---
+FEATURE_SCHEDULER_ENABLED = os.getenv("FEATURE_SCHEDULER_ENABLED", "true").lower() == "true"
+FEATURE_INTERVAL = int(os.getenv("FEATURE_INTERVAL", "60"))  # seconds between runs
+FEATURE_WINDOW_MINUTES = int(os.getenv("FEATURE_WINDOW_MINUTES", "6"))
+FEATURE_WORKERS = int(os.getenv("FEATURE_WORKERS", str(os.cpu_count() or 1)))
+
+
+class FeatureScheduler:
+    """Periodically computes features for every active device and stores them in preprocessed_data"""
+
+    def __init__(self, interval: int = FEATURE_INTERVAL, window_minutes: int = FEATURE_WINDOW_MINUTES,
+                 workers: int = FEATURE_WORKERS):
+        self.interval = interval
+        self.window_minutes = window_minutes
+        self.workers = workers
+        self.executor = None
+        self._task = None
+
+    def _create_executor(self):
+        # spawn keeps TensorFlow's threads out of the worker processes
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def run_in_pool(self, fn, *args):
+        """Run fn(*args) in the worker pool, starting a new pool if a worker died"""
+        if self.executor is None:
+            self.executor = self._create_executor()
+        executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # Concurrent callers see the same broken pool, only the first one replaces it
+            if self.executor is executor:
+                print("⚠️ Feature worker pool is broken, restarting it")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._create_executor()
+            raise
+
+    def start(self):
+        if self.executor is None:
+            self.executor = self._create_executor()
+        self._task = asyncio.create_task(self._run())
+        print(f"✅ Feature scheduler started (every {self.interval}s, {self.workers} workers)")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        print("Feature scheduler stopped")
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"❌ Feature scheduler run failed: {e}")
+            await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    async def run_once(self):
+        """Compute and store features for all active devices, returns the number of saved documents"""
+        device_ids = await fetch_active_devices()
+        if not device_ids:
+            return 0
+
+        windows = await fetch_device_windows(device_ids, self.window_minutes)
+
+        # One batch per worker: the HRV kernel handles a whole batch in one vectorized pass
+        device_order = [device_id for device_id, docs in windows.items() if docs]
+        batch_size = -(-len(device_order) // self.workers) if device_order else 1
+        batches = [device_order[i:i + batch_size] for i in range(0, len(device_order), batch_size)]
+        batch_results = await asyncio.gather(
+            *(self.run_in_pool(compute_features_batch,
+                               {device_id: windows[device_id] for device_id in batch},
+                               self.window_minutes * 60)
+              for batch in batches),
+            return_exceptions=True
+        )
+
+        results = {}
+        for batch, batch_result in zip(batches, batch_results):
+            # A crashed worker fails its whole batch
+            results.update(batch_result if isinstance(batch_result, dict)
+                           else {device_id: batch_result for device_id in batch})
+
+        documents = []
+        for device_id in device_order:
+            result = results[device_id]
+            if isinstance(result, SignalQualityError):
+                print(f"⚠️ Skipped device {device_id}: {result.reason} {result.metrics}")
+                continue
+            if isinstance(result, Exception):
+                print(f"❌ Feature computation failed for device {device_id}: {result}")
+                continue
+            result["source"] = "scheduler"
+            documents.append(result)
+            live_broker.publish("features", device_id, result, result["timestamp"])
+
+        saved = await save_preprocessed_batch(documents)
+        print(f"✅ Scheduled features saved for {saved}/{len(device_ids)} active device(s)")
+        return saved
+
+
+feature_scheduler = FeatureScheduler()
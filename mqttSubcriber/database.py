@@ -5,7 +5,8 @@ import os
 import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient
+from mongo_client import create_mongo_client
+from pymongo import InsertOne, UpdateOne
 
 # Load environment variables from .env file
 load_dotenv()
@@ -36,7 +37,7 @@ class EmotiBitDatabase:
         """Connect to MongoDB database asynchronously"""
         try:
             # Connect to MongoDB using motor async driver
-            self.client = AsyncIOMotorClient(self.mongo_uri)
+            self.client = create_mongo_client(self.mongo_uri, async_client=True)
             
             # Get database and collection
             self.db = self.client[self.db_name]
@@ -56,6 +57,9 @@ class EmotiBitDatabase:
             await status_collection.create_index([("device_id", pymongo.ASCENDING)])
             await status_collection.create_index([("timestamp", pymongo.DESCENDING)])
             
+            # One document per device with its latest status
+            await self.db["device_status_latest"].create_index([("device_id", pymongo.ASCENDING)], unique=True)
+            
             print(f"Connected to MongoDB: {self.db_name}")
             self.connected = True
             return True
@@ -70,7 +74,7 @@ class EmotiBitDatabase:
         """Connect to MongoDB database (synchronous version)"""
         try:
             # Connect to MongoDB
-            self.client = pymongo.MongoClient(self.mongo_uri)
+            self.client = create_mongo_client(self.mongo_uri)
             # print("mongo_uri", self.mongo_uri)
             
             # Check connection
@@ -91,6 +95,9 @@ class EmotiBitDatabase:
             status_collection.create_index([("device_id", pymongo.ASCENDING)])
             status_collection.create_index([("timestamp", pymongo.DESCENDING)])
             
+            # One document per device with its latest status
+            self.db["device_status_latest"].create_index([("device_id", pymongo.ASCENDING)], unique=True)
+            
             print(f"Connected to MongoDB: {self.db_name}")
             self.connected = True
             return True
@@ -123,7 +130,7 @@ class EmotiBitDatabase:
         
         Args:
             topic (str): MQTT topic
-            payload_str (str): JSON payload string
+            payload_str (str | dict): JSON payload string or decoded payload
         
         Returns:
             bool: Success status
@@ -134,7 +141,10 @@ class EmotiBitDatabase:
             
         try:
             # Parse JSON payload
-            payload = json.loads(payload_str)
+            if isinstance(payload_str, dict):
+                payload = dict(payload_str)
+            else:
+                payload = json.loads(payload_str)
             
             # Extract device ID from topic if not in payload
             if "device_id" not in payload and topic.startswith("Emotibit/"):
@@ -169,7 +179,7 @@ class EmotiBitDatabase:
         
         Args:
             topic (str): MQTT topic
-            payload_str (str): JSON payload string
+            payload_str (str | dict): JSON payload string or decoded payload
         
         Returns:
             bool: Success status
@@ -180,7 +190,10 @@ class EmotiBitDatabase:
             
         try:
             # Parse JSON payload
-            payload = json.loads(payload_str)
+            if isinstance(payload_str, dict):
+                payload = dict(payload_str)
+            else:
+                payload = json.loads(payload_str)
             
             # Extract device ID from topic if not in payload
             if "device_id" not in payload and topic.startswith("Emotibit/"):
@@ -209,6 +222,47 @@ class EmotiBitDatabase:
             print(f"Error saving to database: {e}")
             return False
     
+    async def save_preprocessed_data_async(self, documents):
+        """Save computed feature documents to the preprocessed_data collection asynchronously
+        
+        Args:
+            documents (list): Feature documents
+        
+        Returns:
+            bool: Success status
+        """
+        if not self.connected:
+            print("Database not connected")
+            return False
+            
+        try:
+            await self.db["preprocessed_data"].insert_many(documents, ordered=False)
+            return True
+        except Exception as e:
+            print(f"Error saving preprocessed data: {e}")
+            return False
+    
+    # Keep synchronous version
+    def save_preprocessed_data(self, documents):
+        """Save computed feature documents to the preprocessed_data collection
+        
+        Args:
+            documents (list): Feature documents
+        
+        Returns:
+            bool: Success status
+        """
+        if not self.connected:
+            print("Database not connected")
+            return False
+            
+        try:
+            self.db["preprocessed_data"].insert_many(documents, ordered=False)
+            return True
+        except Exception as e:
+            print(f"Error saving preprocessed data: {e}")
+            return False
+    
     async def save_device_status_async(self, device_id, status, timestamp):
         """Save device status to database asynchronously
         
@@ -322,4 +376,104 @@ class EmotiBitDatabase:
             
         except Exception as e:
             print(f"Error saving device status: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def _status_change_requests(self, changes):
+        """Build the bulk requests for a list of (device_id, status, timestamp) changes"""
+        now = datetime.now()
+        history = []
+        latest = []
+        for device_id, status, timestamp in changes:
+            history.append(InsertOne({
+                "device_id": device_id,
+                "status": status,
+                "timestamp": timestamp,
+                "datetime": datetime.fromtimestamp(timestamp),
+                "created_at": now
+            }))
+            latest.append(UpdateOne(
+                {"device_id": device_id},
+                {"$set": {
+                    "status": status,
+                    "timestamp": timestamp,
+                    "datetime": datetime.fromtimestamp(timestamp),
+                    "updated_at": now
+                }},
+                upsert=True
+            ))
+        return history, latest
+    
+    async def save_device_status_changes_async(self, changes):
+        """Save a batch of device status transitions asynchronously
+        
+        Appends to the device_status history and upserts device_status_latest,
+        one bulk_write per collection.
+        
+        Args:
+            changes (list): (device_id, status, timestamp) tuples
+        
+        Returns:
+            bool: Success status
+        """
+        if not self.connected:
+            print("Database not connected")
+            return False
+        if not changes:
+            return True
+            
+        try:
+            history, latest = self._status_change_requests(changes)
+            await self.db["device_status"].bulk_write(history, ordered=False)
+            await self.db["device_status_latest"].bulk_write(latest, ordered=False)
+            print(f"Saved {len(changes)} device status change(s)")
+            return True
+        except Exception as e:
+            print(f"Error saving device status changes: {e}")
+            return False
+    
+    # Keep synchronous version
+    def save_device_status_changes(self, changes):
+        """Save a batch of device status transitions
+        
+        Appends to the device_status history and upserts device_status_latest,
+        one bulk_write per collection.
+        
+        Args:
+            changes (list): (device_id, status, timestamp) tuples
+        
+        Returns:
+            bool: Success status
+        """
+        if not self.connected:
+            print("Database not connected")
+            return False
+        if not changes:
+            return True
+            
+        try:
+            history, latest = self._status_change_requests(changes)
+            self.db["device_status"].bulk_write(history, ordered=False)
+            self.db["device_status_latest"].bulk_write(latest, ordered=False)
+            print(f"Saved {len(changes)} device status change(s)")
+            return True
+        except Exception as e:
+            print(f"Error saving device status changes: {e}")
+            return False
+    
+    def load_latest_statuses(self):
+        """Load the latest status of every device
+        
+        Returns:
+            dict: Device ID -> status
+        """
+        if not self.connected:
+            return {}
+            
+        try:
+            return {
+                doc["device_id"]: doc["status"]
+                for doc in self.db["device_status_latest"].find({}, {"_id": 0, "device_id": 1, "status": 1})
+            }
+        except Exception as e:
+            print(f"Error loading device statuses: {e}")
+            return {}
@@ -0,0 +1,101 @@
+# Device liveness tracking with hysteresis, so flaky connections do not flap
+# between active and inactive on every short dropout
+import os
+import threading
+import time
+
+# Defaults (can be overridden with environment variables)
+ACTIVITY_THRESHOLD = int(os.getenv('ACTIVITY_THRESHOLD', '60'))  # silence before a device is inactive
+STATUS_ACTIVATE_AFTER = int(os.getenv('STATUS_ACTIVATE_AFTER', '5'))  # continuous data before it is active
+STATUS_STREAK_GAP = int(os.getenv('STATUS_STREAK_GAP', '10'))  # a longer gap restarts the data streak
+STATUS_MIN_DWELL = int(os.getenv('STATUS_MIN_DWELL', '120'))  # minimum time between two transitions
+STATUS_FORGET_AFTER = int(os.getenv('STATUS_FORGET_AFTER', '3600'))  # drop inactive devices from memory
+
+
+class DeviceState:
+    __slots__ = ("status", "since", "last_seen", "streak_start")
+
+    def __init__(self, status=None, since=0.0):
+        self.status = status  # None until the first transition is emitted
+        self.since = since  # When the current status was entered
+        self.last_seen = None  # When the last message arrived
+        self.streak_start = None  # Start of the current run of messages
+
+
+class DeviceStatusTracker:
+    def __init__(self, activity_threshold=ACTIVITY_THRESHOLD, activate_after=STATUS_ACTIVATE_AFTER,
+                 streak_gap=STATUS_STREAK_GAP, min_dwell=STATUS_MIN_DWELL, forget_after=STATUS_FORGET_AFTER):
+        """Initialize the tracker
+
+        Args:
+            activity_threshold (int): Seconds without data before a device becomes inactive
+            activate_after (int): Seconds of continuous data before a device becomes active
+            streak_gap (int): Gap in seconds that restarts the continuous data streak
+            min_dwell (int): Minimum seconds a status holds before it may change again
+            forget_after (int): Seconds after which idle inactive devices are forgotten
+        """
+        self.activity_threshold = activity_threshold
+        self.activate_after = activate_after
+        self.streak_gap = streak_gap
+        self.min_dwell = min_dwell
+        self.forget_after = forget_after
+        self.devices = {}  # Device ID -> DeviceState
+        self.lock = threading.Lock()
+
+    def seed(self, statuses, now=None):
+        """Start from the statuses stored in the database
+
+        Args:
+            statuses (dict): Device ID -> "active" / "inactive"
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            for device_id, status in statuses.items():
+                state = DeviceState(status, since=now - self.min_dwell)
+                if status == "active":
+                    # Treat the device as seen at startup; it times out normally if it stays silent
+                    state.last_seen = now
+                self.devices[device_id] = state
+
+    def seen(self, device_id, now=None):
+        """Record a message from a device (safe to call from the MQTT thread)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceState()
+            if state.last_seen is None or now - state.last_seen > self.streak_gap:
+                state.streak_start = now
+            state.last_seen = now
+
+    def check(self, now=None):
+        """Evaluate all devices and return the status changes
+
+        Returns:
+            list: (device_id, status, timestamp) tuples for every transition
+        """
+        now = time.time() if now is None else now
+        changes = []
+        with self.lock:
+            for device_id, state in list(self.devices.items()):
+                silent_for = now - state.last_seen if state.last_seen is not None else None
+                dwell_ok = state.status is None or now - state.since >= self.min_dwell
+
+                if state.status == "active":
+                    if silent_for is not None and silent_for > self.activity_threshold and dwell_ok:
+                        state.status, state.since = "inactive", now
+                        changes.append((device_id, "inactive", int(now)))
+                    continue
+
+                receiving = silent_for is not None and silent_for <= self.streak_gap
+                if receiving and state.last_seen - state.streak_start >= self.activate_after and dwell_ok:
+                    state.status, state.since = "active", now
+                    changes.append((device_id, "active", int(now)))
+                elif silent_for is None or silent_for > self.forget_after:
+                    if state.status is None or now - state.since > self.forget_after:
+                        del self.devices[device_id]
+        return changes
+
+    def active_count(self):
+        with self.lock:
+            return sum(1 for state in self.devices.values() if state.status == "active")
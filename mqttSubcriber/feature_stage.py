@@ -0,0 +1,209 @@
+# Streaming feature extraction: reads per-device sliding windows from the
+# RecentDataStore and computes EDA/PPG/HRV features on a fixed hop, so nothing
+# has to be read back from MongoDB
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import neurokit2 as nk
+import pandas as pd
+
+from signal_quality import QUALITY_GATE_ENABLED, SignalQualityError, check_signal_quality
+
+# Defaults (can be overridden with environment variables)
+FEATURE_WINDOW_SECONDS = int(os.getenv('FEATURE_WINDOW_SECONDS', '360'))  # same 6 minutes the API used
+FEATURE_HOP_SECONDS = int(os.getenv('FEATURE_HOP_SECONDS', '30'))
+FEATURE_MIN_SECONDS = int(os.getenv('FEATURE_MIN_SECONDS', '60'))
+FEATURE_WORKERS = int(os.getenv('FEATURE_WORKERS', '1'))
+FEATURE_TIMEOUT = int(os.getenv('FEATURE_TIMEOUT', '120'))  # seconds a hop may wait for its workers
+
+PPG_SAMPLING_RATE = 100
+EDA_SAMPLING_RATE = 15
+
+
+def compute_features(device_id, eda, ppg, window_seconds):
+    """Run the quality gate and the EDA/PPG/HRV processing on one window
+
+    Produces the same document layout as the classification API so both
+    writers can share the preprocessed_data collection.
+
+    Raises:
+        SignalQualityError: If the window fails the quality gate
+    """
+    quality = {}
+    if QUALITY_GATE_ENABLED:
+        reason, quality = check_signal_quality(ppg, eda, window_seconds)
+        if reason:
+            raise SignalQualityError(reason, quality)
+
+    ppg_signals, _ = nk.ppg_process(ppg, sampling_rate=PPG_SAMPLING_RATE, heart_rate=True)
+    eda_signals, _ = nk.eda_process(eda, sampling_rate=EDA_SAMPLING_RATE)
+    hrv_indices = nk.hrv(ppg_signals['PPG_Peaks'], sampling_rate=PPG_SAMPLING_RATE)
+
+    # Average over the last second of each signal
+    resampled_ppg = ppg_signals.tail(PPG_SAMPLING_RATE).mean()
+    resampled_eda = eda_signals.tail(EDA_SAMPLING_RATE).mean()
+
+    return {
+        "deviceId": device_id,
+        "eda_features": {k: None if pd.isna(v) else float(v) for k, v in resampled_eda.to_dict().items()},
+        "ppg_features": {k: None if pd.isna(v) else float(v) for k, v in resampled_ppg.to_dict().items()},
+        "hrv_indices": {k: None if pd.isna(v) else float(v) for k, v in (hrv_indices.iloc[0].to_dict() if not hrv_indices.empty else {}).items()},
+        "quality": quality,
+        "timestamp": int(time.time()),
+        "source": "ingest"
+    }
+
+
+class FeatureStage:
+    def __init__(self, db, recent_store, window_seconds=FEATURE_WINDOW_SECONDS, hop_seconds=FEATURE_HOP_SECONDS,
+                 min_seconds=FEATURE_MIN_SECONDS, workers=FEATURE_WORKERS, live_events=None):
+        """Initialize the feature stage
+
+        Args:
+            db (EmotiBitDatabase): Connected database used to store the features
+            recent_store (RecentDataStore): Source of the per-device windows
+            window_seconds (int): Length of the sliding window per device
+            hop_seconds (int): How often features are computed
+            min_seconds (int): Minimum amount of data before a device is processed
+            workers (int): Number of worker processes for the signal processing
+            live_events (LiveEventPublisher, optional): Forwards computed features
+        """
+        self.db = db
+        self.recent_store = recent_store
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.min_seconds = min_seconds
+        self.workers = workers
+        self.live_events = live_events
+
+        self.processed = {}  # Device ID -> store update time covered by the last run
+
+        self.executor = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the hop thread and the worker pool"""
+        self.executor = self._create_executor()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="feature-stage", daemon=True)
+        self._thread.start()
+        print(f"Feature stage started (window {self.window_seconds}s, hop {self.hop_seconds}s)")
+
+    def _create_executor(self):
+        # spawn: workers are started from the hop thread while paho and pymongo threads
+        # are running, and forking a multi-threaded process can deadlock the child
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _replace_executor(self):
+        """Kill the current workers and start a fresh pool
+
+        shutdown() alone leaves a hung worker running, so its processes are
+        terminated explicitly. Also recovers a pool broken by a killed worker.
+        """
+        processes = list((getattr(self.executor, "_processes", None) or {}).values())
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        self.executor = self._create_executor()
+
+    def stop(self):
+        """Stop the hop thread and the worker pool"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        print("Feature stage stopped")
+
+    def _run(self):
+        while not self._stop_event.wait(self.hop_seconds):
+            try:
+                self.process_windows()
+            except Exception as e:
+                print(f"Error in feature stage: {e}")
+
+    def _snapshot(self):
+        """Read the windows of devices that received data since the last hop"""
+        jobs = {}
+        device_ids = self.recent_store.device_ids()
+        for device_id in device_ids:
+            last_update = self.recent_store.last_update(device_id)
+            if last_update is None or last_update <= self.processed.get(device_id, 0):
+                continue
+
+            window = self.recent_store.query(device_id, self.window_seconds, ("eda", "ppg"))
+            if "eda" not in window or "ppg" not in window:
+                continue  # Evicted since device_ids() was read
+            _, eda = window["eda"]
+            ppg_times, ppg = window["ppg"]
+            span = int(ppg_times[-1] - ppg_times[0]) + 1 if len(ppg_times) else 0
+            if span < self.min_seconds:
+                continue
+            jobs[device_id] = (eda, ppg, min(span, self.window_seconds))
+            self.processed[device_id] = last_update
+
+        # Forget devices the store has evicted
+        for device_id in set(self.processed) - set(device_ids):
+            del self.processed[device_id]
+        return jobs
+
+    def _submit(self, jobs):
+        return {
+            device_id: self.executor.submit(compute_features, device_id, *job)
+            for device_id, job in jobs.items()
+        }
+
+    def process_windows(self):
+        """Compute features for every device with enough data and store them in one batch
+
+        Returns:
+            int: Number of saved feature documents
+        """
+        jobs = self._snapshot()
+        if not jobs:
+            return 0
+
+        try:
+            futures = self._submit(jobs)
+        except BrokenProcessPool:
+            print("Feature worker pool is broken, restarting it")
+            self._replace_executor()
+            futures = self._submit(jobs)
+
+        documents = []
+        deadline = time.monotonic() + FEATURE_TIMEOUT
+        replace_pool = False
+        for device_id, future in futures.items():
+            try:
+                documents.append(future.result(timeout=max(0, deadline - time.monotonic())))
+            except TimeoutError:
+                print(f"Timed out computing features for device {device_id}")
+                replace_pool = True
+            except BrokenProcessPool:
+                print(f"Feature worker died while processing device {device_id}")
+                replace_pool = True
+            except SignalQualityError as e:
+                print(f"Skipped device {device_id}: {e.reason} {e.metrics}")
+            except Exception as e:
+                print(f"Error computing features for device {device_id}: {e}")
+
+        if replace_pool:
+            # A hung or dead worker must not stall or break the following hops
+            self._replace_executor()
+
+        if self.live_events:
+            for document in documents:
+                self.live_events.publish("features", document["deviceId"], document, document["timestamp"])
+
+        if documents and self.db.save_preprocessed_data(documents):
+            print(f"Saved features for {len(documents)} device(s)")
+        return len(documents)
@@ -0,0 +1,62 @@
+# Forwards live events (latest readings, liveness changes, features) through the
+# MQTT broker so the classification API can push them to dashboards
+import os
+import time
+
+from payload_codec import encode_payload
+
+# Defaults (can be overridden with environment variables)
+LIVE_EVENTS_ENABLED = os.getenv('LIVE_EVENTS_ENABLED', 'false').lower() == 'true'
+LIVE_TOPIC_PREFIX = os.getenv('LIVE_TOPIC_PREFIX', 'EmotibitLive')
+LIVE_EVENT_ENCODING = os.getenv('LIVE_EVENT_ENCODING', 'zstd')
+
+# Encodings the API's live bridge can decode without extra dependencies
+LIVE_EVENT_ENCODINGS = ("json", "zlib", "zstd")
+
+
+def summarize_reading(payload):
+    """Latest values of a reading instead of the full sample arrays"""
+    summary = {}
+    for channel, samples in (payload.get("sensors") or {}).items():
+        if isinstance(samples, (list, tuple)):
+            if samples:
+                summary[channel] = samples[-1]
+                summary[f"{channel}_samples"] = len(samples)
+        else:
+            summary[channel] = samples
+    return summary
+
+
+class LiveEventPublisher:
+    def __init__(self, mqtt_handler, prefix=LIVE_TOPIC_PREFIX, encoding=LIVE_EVENT_ENCODING):
+        """Initialize the publisher
+
+        Args:
+            mqtt_handler (MQTTHandler): Connected handler used to publish
+            prefix (str): Topic prefix, events go to <prefix>/<device_id>/<type>
+            encoding (str): Event encoding, one of LIVE_EVENT_ENCODINGS
+        """
+        if encoding not in LIVE_EVENT_ENCODINGS:
+            raise ValueError(f"Unknown live event encoding {encoding!r}, expected one of {LIVE_EVENT_ENCODINGS}")
+        self.mqtt_handler = mqtt_handler
+        self.prefix = prefix
+        self.encoding = encoding
+
+    def publish(self, event_type, device_id, data, timestamp=None):
+        """Publish one event
+
+        Args:
+            event_type (str): reading, status or features
+            device_id (str): Device ID
+            data (dict): Event payload
+            timestamp (int, optional): Unix timestamp, defaults to now
+        """
+        event = {"data": data, "timestamp": timestamp or int(time.time())}
+        self.mqtt_handler.publish(f"{self.prefix}/{device_id}/{event_type}", encode_payload(event, self.encoding))
+
+    def __call__(self, topic, payload):
+        """MQTT callback: forward the latest values of every reading as a live event"""
+        if not topic.startswith("Emotibit/"):
+            return
+        device_id = payload.get("device_id") or topic.split("/")[1]
+        self.publish("reading", device_id, summarize_reading(payload), payload.get("timestamp"))
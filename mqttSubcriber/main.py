@@ -1,15 +1,16 @@
+import os
 import time
 from mqtt_handle import MQTTHandler
 from database import EmotiBitDatabase
-import json
-from datetime import datetime
+from live_events import LiveEventPublisher, LIVE_EVENTS_ENABLED
+from device_status import DeviceStatusTracker
+from recent_store import RecentDataStore, RECENT_STORE_SECONDS
 
-db = EmotiBitDatabase()
-db_connected = db.connect()
+MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', 'broker.emqx.io')
+MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', '1883'))
 
-active_devices = {}
-
-ACTIVITY_THRESHOLD = 60  # 1 minute
+# Optional on-ingest feature extraction (needs neurokit2)
+FEATURE_STAGE_ENABLED = os.getenv('FEATURE_STAGE_ENABLED', 'false').lower() == 'true'
 
 def process_emotibit_data(topic, payload):
     """Custom callback function to process EmotiBit data"""
@@ -17,20 +18,14 @@ def process_emotibit_data(topic, payload):
     if topic.startswith("Emotibit/"):
         device_id = topic.split("/")[1]
         
-        # Update device activity status - this line was missing
-        current_time = datetime.now()
-        was_inactive = device_id not in active_devices
-        active_devices[device_id] = current_time
-        
-        if was_inactive and db_connected:
-            save_device_status(device_id, "active")
-            print(f"Device {device_id} is now ACTIVE")
+        # Update device activity, transitions are evaluated in check_device_status
+        status_tracker.seen(device_id)
         
         print(f"Processing data from device: {device_id}")
         
-        # You could parse JSON data and process it further
+        # Payload arrives already decoded by MQTTHandler
         try:
-            data = json.loads(payload)
+            data = payload
             # Process your data here
             if "sensors" in data:
                 if "skintemp" in data["sensors"]:
@@ -49,79 +44,105 @@ def process_emotibit_data(topic, payload):
                     data["timestamp"] = int(time.time())
 
                 # Save to database
-                success = db.save_sensor_data(topic, payload)
+                success = db.save_sensor_data(topic, data)
                 if success:
                     print(f"Data saved to database for device {device_id}")
                 else:
                     print(f"Failed to save data for device {device_id}")
                 
-        except json.JSONDecodeError:
-            print("Received message is not valid JSON")
         except Exception as e:
             print(f"Error processing data: {e}")
 
 def check_device_status():
-    current_time = datetime.now()
-    inactive_devices = []
-
-    for device_id, last_active in list(active_devices.items()):
-        time_diff = (current_time - last_active).total_seconds()
-        if time_diff > ACTIVITY_THRESHOLD:
-            print(f"Device {device_id} is inactive for {time_diff:.1f} seconds")
-            inactive_devices.append(device_id)
+    changes = status_tracker.check()
+
+    for device_id, status, timestamp in changes:
+        print(f"Device {device_id} is now {status.upper()}")
+        if live_events:
+            live_events.publish("status", device_id, {"status": status}, timestamp)
     
-    for device_id in inactive_devices:
-        if db_connected:
-            save_device_status(device_id, "inactive")
-            print(f"Device {device_id} marked as INACTIVE")
-        del active_devices[device_id]
+    if changes and db_connected:
+        save_device_status_changes(changes)
     
-    return len(active_devices)
+    return status_tracker.active_count()
 
-def save_device_status(device_id, status):
-    """Save device status to database"""
-    timestamp = int(time.time())
+def save_device_status_changes(changes):
+    """Save all status transitions of one check interval to database"""
     try:
-        success = db.save_device_status(device_id, status, timestamp)
-        if success:
-            print(f"Status '{status}' saved to database for device {device_id}")
-        else:
-            print(f"Failed to save status for device {device_id}")
+        success = db.save_device_status_changes(changes)
+        if not success:
+            print(f"Failed to save {len(changes)} device status change(s)")
     except Exception as e:
         print(f"Error saving device status: {e}")
 
-# Create MQTT handler
-mqtt_handler = MQTTHandler()
 
-# Add custom callback
-mqtt_handler.add_callback(process_emotibit_data)
+if __name__ == "__main__":
+    # Startup stays under the guard so spawned feature workers can import this module safely
+    db = EmotiBitDatabase()
+    db_connected = db.connect()
+
+    # Liveness with hysteresis (ACTIVITY_THRESHOLD, STATUS_* env vars, see device_status.py)
+    status_tracker = DeviceStatusTracker()
+    if db_connected:
+        status_tracker.seed(db.load_latest_statuses())
+
+    # Recent samples per device, kept long enough for the feature stage's window
+    recent_seconds = RECENT_STORE_SECONDS
+    if FEATURE_STAGE_ENABLED:
+        from feature_stage import FeatureStage, FEATURE_WINDOW_SECONDS
+        recent_seconds = max(recent_seconds, FEATURE_WINDOW_SECONDS)
+    recent_store = RecentDataStore(seconds=recent_seconds)
+
+    # Create MQTT handler
+    mqtt_handler = MQTTHandler(broker=MQTT_BROKER_HOST, port=MQTT_BROKER_PORT, recent_store=recent_store)
+
+    # Add custom callback
+    mqtt_handler.add_callback(process_emotibit_data)
 
-# Connect and start
-if mqtt_handler.connect():
-    mqtt_handler.start()
+    # Forward readings and status changes for the API's live stream
+    live_events = None
+    if LIVE_EVENTS_ENABLED:
+        live_events = LiveEventPublisher(mqtt_handler)
+        mqtt_handler.add_callback(live_events)
+
+    feature_stage = None
+    if FEATURE_STAGE_ENABLED and db_connected:
+        feature_stage = FeatureStage(db, recent_store, live_events=live_events)
+
+    # Connect and start
+    if mqtt_handler.connect():
+        mqtt_handler.start()
+        if feature_stage:
+            feature_stage.start()
     
-    try:
-        print("EmotiBit MQTT Subscriber running. Press Ctrl+C to stop.")
-        last_status_check = time.time()
-
-        # Main application loop
-        while True:
-            messages = mqtt_handler.get_latest_message()
-
-            # Check device status every 5 seconds
-            current_time = time.time()
-            if current_time - last_status_check >= 5:
-                active_count = check_device_status()
-                print(f"Status: {active_count} active EmotiBit device(s)")
-                last_status_check = current_time
+        try:
+            print("EmotiBit MQTT Subscriber running. Press Ctrl+C to stop.")
+            last_status_check = time.time()
+
+            # Main application loop
+            while True:
+                # Check device status every 5 seconds
+                current_time = time.time()
+                if current_time - last_status_check >= 5:
+                    active_count = check_device_status()
+                    for device_id in recent_store.evict_idle():
+                        print(f"Evicted recent data of idle device {device_id}")
+                    print(f"Status: {active_count} active EmotiBit device(s)")
+                    for encoding, stats in mqtt_handler.get_decode_stats().items():
+                        print(f"Payloads [{encoding}]: {stats['messages']} messages, "
+                              f"{stats['bytes'] / stats['messages']:.0f} bytes avg, "
+                              f"{stats['seconds'] / stats['messages'] * 1e6:.0f} µs decode avg")
+                    last_status_check = current_time
             
-            # Sleep to avoid high CPU usage
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("Stopping application...")
-    finally:
-        mqtt_handler.stop()
-        if db_connected:
-            db.close()
-else:
-    print("Failed to connect to MQTT broker, exiting.")
\ No newline at end of file
+                # Sleep to avoid high CPU usage
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("Stopping application...")
+        finally:
+            mqtt_handler.stop()
+            if feature_stage:
+                feature_stage.stop()
+            if db_connected:
+                db.close()
+    else:
+        print("Failed to connect to MQTT broker, exiting.")
\ No newline at end of file
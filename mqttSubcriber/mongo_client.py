@@ -0,0 +1,93 @@
+# MongoDB client factory shared by the sync and async code paths.
+# The classification API carries the same factory in config/mongo.py, both read
+# the same environment variables so the services are tuned in one place.
+import importlib.util
+import os
+
+import pymongo
+from pymongo import ReadPreference
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Settings are read when a client is created so values loaded from .env apply.
+#   MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE / MONGO_MAX_IDLE_TIME_MS   connection pool
+#   MONGO_CONNECT_TIMEOUT_MS / MONGO_SERVER_SELECTION_TIMEOUT_MS / MONGO_SOCKET_TIMEOUT_MS
+#   MONGO_COMPRESSORS                  wire compression, in order of preference
+#   MONGO_ANALYTICS_READ_PREFERENCE    read preference for analytics reads (exports)
+DEFAULTS = {
+    'MONGO_URI': 'mongodb://localhost:27017/',
+    'MONGO_DB_NAME': 'emotibit_data',
+    'MONGO_MAX_POOL_SIZE': '50',
+    'MONGO_MIN_POOL_SIZE': '0',
+    'MONGO_MAX_IDLE_TIME_MS': '60000',
+    'MONGO_CONNECT_TIMEOUT_MS': '5000',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': '5000',
+    'MONGO_SOCKET_TIMEOUT_MS': '30000',
+    'MONGO_COMPRESSORS': 'zstd,snappy,zlib',
+    'MONGO_ANALYTICS_READ_PREFERENCE': 'secondaryPreferred',
+}
+
+# Python module each compressor needs, zlib is part of the standard library
+_COMPRESSOR_MODULES = {'zstd': 'zstandard', 'snappy': 'snappy', 'zlib': 'zlib'}
+
+_READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def setting(name):
+    return os.getenv(name, DEFAULTS[name])
+
+
+def available_compressors(names=None):
+    """Return the configured compressors whose libraries are installed"""
+    names = names or setting('MONGO_COMPRESSORS')
+    compressors = []
+    for name in (n.strip() for n in names.split(',')):
+        module = _COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module) is not None:
+            compressors.append(name)
+    return compressors
+
+
+def client_options():
+    """Keyword arguments shared by every MongoClient / AsyncIOMotorClient"""
+    options = {
+        'maxPoolSize': int(setting('MONGO_MAX_POOL_SIZE')),
+        'minPoolSize': int(setting('MONGO_MIN_POOL_SIZE')),
+        'maxIdleTimeMS': int(setting('MONGO_MAX_IDLE_TIME_MS')),
+        'connectTimeoutMS': int(setting('MONGO_CONNECT_TIMEOUT_MS')),
+        'serverSelectionTimeoutMS': int(setting('MONGO_SERVER_SELECTION_TIMEOUT_MS')),
+        'socketTimeoutMS': int(setting('MONGO_SOCKET_TIMEOUT_MS')),
+    }
+    compressors = available_compressors()
+    if compressors:
+        options['compressors'] = ','.join(compressors)
+    return options
+
+
+def create_mongo_client(mongo_uri=None, async_client=False):
+    """Create a tuned MongoDB client
+
+    Args:
+        mongo_uri (str, optional): Connection string. If None, uses MONGO_URI env var.
+        async_client (bool): Return a motor AsyncIOMotorClient instead of a pymongo MongoClient
+
+    Returns:
+        MongoClient | AsyncIOMotorClient: The client
+    """
+    client_class = AsyncIOMotorClient if async_client else pymongo.MongoClient
+    return client_class(mongo_uri or setting('MONGO_URI'), **client_options())
+
+
+def get_database(client, db_name=None, analytics=False):
+    """Get a database handle, analytics handles use MONGO_ANALYTICS_READ_PREFERENCE"""
+    db_name = db_name or setting('MONGO_DB_NAME')
+    if not analytics:
+        return client[db_name]
+    read_preference = _READ_PREFERENCES.get(setting('MONGO_ANALYTICS_READ_PREFERENCE'),
+                                            ReadPreference.SECONDARY_PREFERRED)
+    return client.get_database(db_name, read_preference=read_preference)
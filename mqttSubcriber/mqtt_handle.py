@@ -2,9 +2,11 @@
 import paho.mqtt.client as mqtt
 import time
 import json
+from payload_codec import decode_payload
+from recent_store import RecentDataStore
 
 class MQTTHandler:
-    def __init__(self, broker="broker.emqx.io", port=1883, keep_alive=60):
+    def __init__(self, broker="broker.emqx.io", port=1883, keep_alive=60, recent_store=None):
         """Initialize the MQTT handler with broker configuration"""
         # Broker configuration
         self.broker_address = broker
@@ -22,9 +24,10 @@ class MQTTHandler:
         # Subscription topics
         self.subscription_topic = "Emotibit/#"  # Default subscription to all Emotibit topics
         
-        # Message storage for data access from main application
-        self.latest_messages = {}  # Topic -> Message dictionary
+        # Recent samples per device for data access from main application
+        self.recent_store = recent_store or RecentDataStore()
         self.callbacks = []  # List of custom callback functions 
+        self.decode_stats = {}  # Encoding -> {"messages", "bytes", "seconds"}
         
     def connect(self):
         """Connect to the MQTT broker"""
@@ -53,15 +56,30 @@ class MQTTHandler:
         self.client.subscribe(self.subscription_topic)
         print(f"Subscribed to {self.subscription_topic}")
         
+    def publish(self, topic, payload, qos=0):
+        """Publish a message to the broker (safe to call from any thread)"""
+        try:
+            self.client.publish(topic, payload, qos=qos)
+        except Exception as e:
+            print(f"Error publishing to {topic}: {e}")
+    
     def add_callback(self, callback_function):
-        """Add a custom callback function to be called with received messages"""
+        """Add a custom callback function to be called with received messages
+        
+        Callbacks are called as callback(topic, payload) with the decoded payload dict.
+        """
         self.callbacks.append(callback_function)
         
-    def get_latest_message(self, topic=None):
-        """Get the latest message for a specific topic or all messages"""
-        if topic:
-            return self.latest_messages.get(topic)
-        return self.latest_messages
+    def get_recent_data(self, device_id, seconds, channels=None):
+        """Get the last `seconds` of samples of a device as (times, values) arrays per channel"""
+        return self.recent_store.query(device_id, seconds, channels)
+    
+    def get_decode_stats(self):
+        """Get a snapshot of message count, payload bytes and decode time per payload encoding
+        
+        Copied because the MQTT thread adds encodings while callers iterate.
+        """
+        return {encoding: dict(stats) for encoding, stats in list(self.decode_stats.items())}
     
     def _on_connect(self, client, userdata, flags, rc):
         """Internal callback for connection"""
@@ -75,14 +93,24 @@ class MQTTHandler:
     def _on_message(self, client, userdata, msg):
         """Internal callback for message reception"""
         try:
-            # Decode the payload
-            payload = msg.payload.decode()
+            # Decode the payload (JSON, MessagePack, CBOR, compressed or packed binary)
+            started = time.perf_counter()
+            payload, encoding = decode_payload(msg.payload)
+            elapsed = time.perf_counter() - started
+            
+            stats = self.decode_stats.setdefault(encoding, {"messages": 0, "bytes": 0, "seconds": 0.0})
+            stats["messages"] += 1
+            stats["bytes"] += len(msg.payload)
+            stats["seconds"] += elapsed
             
-            # Store the latest message for this topic
-            self.latest_messages[msg.topic] = payload
+            # Keep the samples in the recent data store (best effort, never blocks ingestion)
+            try:
+                self.recent_store(msg.topic, payload)
+            except Exception as e:
+                print(f"Error updating recent data store: {e}")
             
             # Print received message
-            print(f"Received message on {msg.topic}: {payload}")
+            print(f"Received {encoding} message on {msg.topic} ({len(msg.payload)} bytes)")
             
             # Call any custom callbacks
             for callback in self.callbacks:
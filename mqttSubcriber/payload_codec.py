@@ -0,0 +1,238 @@
+# Encoding and decoding of EmotiBit MQTT payloads
+#
+# Supported encodings, detected from the first bytes of the payload:
+#   json     plain JSON text (what devices publish by default)
+#   msgpack  MessagePack map
+#   cbor     CBOR map
+#   zlib     zlib-compressed JSON/MessagePack/CBOR
+#   zstd     zstd-compressed JSON/MessagePack/CBOR
+#   packed   compact binary sample frame, see PACKED_HEADER below
+import json
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENCODINGS = ("json", "msgpack", "cbor", "zlib", "zstd", "packed")
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZLIB_HEADERS = (b"\x78\x01", b"\x78\x5e", b"\x78\x9c", b"\x78\xda")
+CBOR_SELF_DESCRIBE = b"\xd9\xd9\xf7"
+
+# Largest decompressed payload accepted, so a tiny compressed frame from any client on
+# the broker cannot expand into hundreds of megabytes in the ingest process
+MAX_DECOMPRESSED_SIZE = 1 << 20
+
+# Packed frame:
+#   magic "EB", version, flags, timestamp (uint32), skin temperature (int16, 0.01 °C),
+#   EDA sample count (uint16), PPG sample count (uint16), device ID length (uint8)
+# followed by the UTF-8 device ID, the EDA samples (float32) and the PPG samples
+# (uint16 when FLAG_PPG_UINT16 is set, float32 otherwise). Little endian throughout.
+PACKED_MAGIC = b"EB"
+PACKED_VERSION = 1
+PACKED_HEADER = struct.Struct("<2sBBIhHHB")
+FLAG_PPG_UINT16 = 0x01
+SKINTEMP_MISSING = -32768
+
+
+def detect_encoding(raw):
+    """Guess the encoding of a raw payload from its first bytes"""
+    if raw[:2] == PACKED_MAGIC:
+        return "packed"
+    if raw[:4] == ZSTD_MAGIC:
+        return "zstd"
+    if raw[:2] in ZLIB_HEADERS:
+        return "zlib"
+    first = raw[:1]
+    if not first:
+        return "json"
+    byte = first[0]
+    # MessagePack maps: fixmap, map16, map32
+    if 0x80 <= byte <= 0x8f or byte in (0xde, 0xdf):
+        return "msgpack"
+    # CBOR maps (major type 5) or the self-describe tag
+    if 0xa0 <= byte <= 0xbf or raw[:3] == CBOR_SELF_DESCRIBE:
+        return "cbor"
+    return "json"
+
+
+def decode_payload(raw):
+    """Decode a raw MQTT payload into a dictionary
+
+    Args:
+        raw (bytes): Payload as received from the broker
+
+    Returns:
+        tuple: (decoded dict, encoding name)
+
+    Raises:
+        ValueError: If the payload cannot be decoded
+    """
+    encoding = detect_encoding(raw)
+
+    if encoding in ("zlib", "zstd"):
+        inner = _decode_uncompressed(decompress(raw, encoding))
+    else:
+        inner = _decode_uncompressed(raw)
+
+    if not isinstance(inner, dict):
+        raise ValueError(f"Payload does not contain an object ({encoding})")
+    return inner, encoding
+
+
+def decompress(raw, encoding, limit=MAX_DECOMPRESSED_SIZE):
+    """Decompress a zlib or zstd payload, refusing output larger than limit bytes
+
+    Raises:
+        ValueError: If the payload is corrupt, truncated or expands beyond the limit
+    """
+    if encoding == "zlib":
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(raw, limit)
+        except zlib.error as e:
+            raise ValueError(f"Invalid zlib payload: {e}")
+        if decompressor.unconsumed_tail:
+            raise ValueError(f"Decompressed payload exceeds {limit} bytes")
+        if not decompressor.eof:
+            raise ValueError("Truncated zlib payload")
+        return data
+
+    if zstandard is None:
+        raise ValueError("zstd payload received but the zstandard module is not installed")
+    try:
+        declared = zstandard.frame_content_size(raw)
+        if declared > limit:
+            raise ValueError(f"Decompressed payload exceeds {limit} bytes")
+        # Frames without a declared size are read through a stream capped at the limit
+        chunks, size = [], 0
+        with zstandard.ZstdDecompressor().stream_reader(raw) as reader:
+            while size <= limit:
+                chunk = reader.read(limit + 1 - size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid zstd payload: {e}")
+    if size > limit:
+        raise ValueError(f"Decompressed payload exceeds {limit} bytes")
+    return b"".join(chunks)
+
+
+def _decode_uncompressed(raw):
+    encoding = detect_encoding(raw)
+    if encoding == "packed":
+        return unpack_frame(raw)
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise ValueError("MessagePack payload received but the msgpack module is not installed")
+        return msgpack.unpackb(raw, raw=False)
+    if encoding == "cbor":
+        if cbor2 is None:
+            raise ValueError("CBOR payload received but the cbor2 module is not installed")
+        return cbor2.loads(raw)
+    if encoding in ("zlib", "zstd"):
+        raise ValueError("Nested compression is not supported")
+    try:
+        return json.loads(raw)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON payload: {e}")
+
+
+def encode_payload(data, encoding="json"):
+    """Encode a reading dictionary with the given encoding
+
+    Args:
+        data (dict): Reading with device_id, timestamp and sensors
+        encoding (str): One of ENCODINGS
+
+    Returns:
+        bytes: Encoded payload
+    """
+    if encoding == "json":
+        return json.dumps(data, default=str).encode()
+    if encoding == "msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    if encoding == "cbor":
+        return cbor2.dumps(data)
+    if encoding == "zlib":
+        return zlib.compress(json.dumps(data, default=str).encode())
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor().compress(json.dumps(data, default=str).encode())
+    if encoding == "packed":
+        return pack_frame(data)
+    raise ValueError(f"Unknown encoding: {encoding}")
+
+
+def pack_frame(data):
+    """Pack a reading into the compact binary frame"""
+    sensors = data.get("sensors") or {}
+    device_id = str(data.get("device_id", "")).encode()
+    eda = sensors.get("eda") or []
+    ppg = sensors.get("ppg") or []
+    skintemp = sensors.get("skintemp")
+
+    flags = 0
+    if all(isinstance(v, int) and 0 <= v <= 0xffff for v in ppg):
+        flags |= FLAG_PPG_UINT16
+    ppg_format = "H" if flags & FLAG_PPG_UINT16 else "f"
+
+    header = PACKED_HEADER.pack(
+        PACKED_MAGIC,
+        PACKED_VERSION,
+        flags,
+        int(data.get("timestamp", 0)),
+        SKINTEMP_MISSING if skintemp is None else round(skintemp * 100),
+        len(eda),
+        len(ppg),
+        len(device_id),
+    )
+    return b"".join([
+        header,
+        device_id,
+        struct.pack(f"<{len(eda)}f", *eda),
+        struct.pack(f"<{len(ppg)}{ppg_format}", *ppg),
+    ])
+
+
+def unpack_frame(raw):
+    """Unpack a compact binary frame into the JSON reading layout"""
+    if len(raw) < PACKED_HEADER.size:
+        raise ValueError("Packed frame is too short")
+    magic, version, flags, timestamp, skintemp, n_eda, n_ppg, id_length = PACKED_HEADER.unpack_from(raw)
+    if version != PACKED_VERSION:
+        raise ValueError(f"Unsupported packed frame version: {version}")
+
+    ppg_format = "H" if flags & FLAG_PPG_UINT16 else "f"
+    expected = PACKED_HEADER.size + id_length + 4 * n_eda + struct.calcsize(f"<{n_ppg}{ppg_format}")
+    if len(raw) != expected:
+        raise ValueError(f"Packed frame length {len(raw)} does not match header ({expected})")
+
+    offset = PACKED_HEADER.size
+    device_id = raw[offset:offset + id_length].decode()
+    offset += id_length
+    eda = list(struct.unpack_from(f"<{n_eda}f", raw, offset))
+    offset += 4 * n_eda
+    ppg = list(struct.unpack_from(f"<{n_ppg}{ppg_format}", raw, offset))
+
+    sensors = {"eda": eda, "ppg": ppg}
+    if skintemp != SKINTEMP_MISSING:
+        sensors["skintemp"] = skintemp / 100
+    data = {"timestamp": timestamp, "sensors": sensors}
+    if device_id:
+        data["device_id"] = device_id
+    return data
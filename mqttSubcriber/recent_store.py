@@ -0,0 +1,173 @@
+# In-memory store of recent sensor data: one fixed-size NumPy ring buffer per
+# device and channel, so other stages can read the last seconds without MongoDB
+import os
+import threading
+import time
+
+import numpy as np
+
+# Defaults (can be overridden with environment variables)
+RECENT_STORE_SECONDS = int(os.getenv('RECENT_STORE_SECONDS', '360'))
+RECENT_STORE_IDLE_SECONDS = int(os.getenv('RECENT_STORE_IDLE_SECONDS', '300'))
+
+# Nominal samples per second of each channel
+CHANNEL_RATES = {"ppg": 100, "eda": 15, "skintemp": 1}
+
+# Head room for devices that send slightly faster than nominal
+CAPACITY_MARGIN = 1.25
+
+
+class RingBuffer:
+    """Fixed capacity buffer of (time, value) samples, oldest samples are overwritten
+
+    Samples are kept in time order so windows can be found with a binary search;
+    samples that are not newer than the newest stored one (late or repeated packets)
+    are dropped and counted in `late`.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.head = 0  # Next write position
+        self.late = 0  # Samples dropped because they arrived out of order
+
+    def extend(self, times, values):
+        if self.size:
+            newest = self.times[(self.head - 1) % self.capacity]
+            newer = times > newest
+            if not newer.all():
+                self.late += len(times) - int(newer.sum())
+                times, values = times[newer], values[newer]
+        n = len(values)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            times, values, n = times[-self.capacity:], values[-self.capacity:], self.capacity
+
+        end = self.head + n
+        if end <= self.capacity:
+            self.times[self.head:end] = times
+            self.values[self.head:end] = values
+        else:
+            split = self.capacity - self.head
+            self.times[self.head:] = times[:split]
+            self.values[self.head:] = values[:split]
+            self.times[:end - self.capacity] = times[split:]
+            self.values[:end - self.capacity] = values[split:]
+
+        self.head = end % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def ordered(self):
+        """Return copies of the samples, oldest first"""
+        start = (self.head - self.size) % self.capacity
+        index = (start + np.arange(self.size)) % self.capacity
+        return self.times[index], self.values[index]
+
+    def since(self, t0):
+        """Return copies of the samples with time >= t0, oldest first"""
+        times, values = self.ordered()
+        first = np.searchsorted(times, t0, side="left")
+        return times[first:], values[first:]
+
+
+class DeviceBuffer:
+    def __init__(self, seconds, rates):
+        self.channels = {
+            channel: RingBuffer(max(1, int(rate * seconds * CAPACITY_MARGIN)))
+            for channel, rate in rates.items()
+        }
+        self.latest_timestamp = None  # Newest packet timestamp
+        self.last_update = None  # time.time() of the last append
+
+
+class RecentDataStore:
+    def __init__(self, seconds=RECENT_STORE_SECONDS, idle_seconds=RECENT_STORE_IDLE_SECONDS, rates=None):
+        """Initialize the store
+
+        Args:
+            seconds (int): How much history each device keeps
+            idle_seconds (int): Devices without data for this long are evicted
+            rates (dict, optional): Channel -> nominal samples per second
+        """
+        self.seconds = seconds
+        self.idle_seconds = idle_seconds
+        self.rates = rates or CHANNEL_RATES
+        self.devices = {}  # Device ID -> DeviceBuffer
+        self.lock = threading.Lock()
+
+    def append(self, device_id, timestamp, sensors):
+        """Add one packet of samples
+
+        Args:
+            device_id (str): Device ID
+            timestamp (int): Packet timestamp, samples are spread across the following second
+            sensors (dict): Channel -> list of samples (or a single value)
+        """
+        with self.lock:
+            buffer = self.devices.get(device_id)
+            if buffer is None:
+                buffer = self.devices[device_id] = DeviceBuffer(self.seconds, self.rates)
+
+            for channel, ring in buffer.channels.items():
+                samples = sensors.get(channel)
+                if samples is None:
+                    continue
+                values = np.atleast_1d(np.asarray(samples, dtype=np.float64))
+                n = len(values)
+                ring.extend(timestamp + np.arange(n, dtype=np.float64) / n, values)
+
+            if buffer.latest_timestamp is None or timestamp > buffer.latest_timestamp:
+                buffer.latest_timestamp = timestamp
+            buffer.last_update = time.time()
+
+    def query(self, device_id, seconds, channels=None):
+        """Return the last `seconds` of data of a device
+
+        The window ends at the device's newest packet, not at the wall clock.
+
+        Returns:
+            dict: Channel -> (times, values) arrays, empty dict for unknown devices
+        """
+        with self.lock:
+            buffer = self.devices.get(device_id)
+            if buffer is None:
+                return {}
+            t0 = buffer.latest_timestamp + 1 - seconds
+            return {
+                channel: ring.since(t0)
+                for channel, ring in buffer.channels.items()
+                if channels is None or channel in channels
+            }
+
+    def last_update(self, device_id):
+        with self.lock:
+            buffer = self.devices.get(device_id)
+            return buffer.last_update if buffer else None
+
+    def device_ids(self):
+        with self.lock:
+            return list(self.devices)
+
+    def evict_idle(self, now=None):
+        """Drop devices that have been quiet for idle_seconds
+
+        Returns:
+            list: Evicted device IDs
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            idle = [d for d, b in self.devices.items() if now - b.last_update > self.idle_seconds]
+            for device_id in idle:
+                del self.devices[device_id]
+        return idle
+
+    def __call__(self, topic, payload):
+        """MQTT callback: append the decoded reading"""
+        if not topic.startswith("Emotibit/"):
+            return
+        device_id = payload.get("device_id") or topic.split("/")[1]
+        timestamp = payload.get("timestamp")
+        self.append(device_id, float(timestamp) if timestamp else time.time(), payload.get("sensors") or {})
@@ -0,0 +1,310 @@
+# Replay recorded sensor traffic to an MQTT broker, for reprocessing and load testing
+#
+# Reads sensor_readings from MongoDB, the Parquet archive written by retention.py or a
+# JSONL file (mongoexport output), merges all devices into one timeline and republishes
+# every reading on Emotibit/<device_id> with its original per-device timing.
+#
+# Usage:
+#   python replay.py --start 2025-05-01 --end 2025-05-02 --speed 10
+#   python replay.py --archive ./archive --devices Emotibit-001 --speed 0 --encoding msgpack
+#   python replay.py --jsonl readings.jsonl --retime --clients 4
+import argparse
+import heapq
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+import paho.mqtt.client as mqtt
+
+from payload_codec import ENCODINGS, encode_payload
+
+# Defaults (can be overridden with environment variables or CLI flags)
+REPLAY_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', 'localhost')
+REPLAY_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', '1883'))
+REPLAY_TOPIC_PREFIX = os.getenv('REPLAY_TOPIC_PREFIX', 'Emotibit')
+
+CURSOR_BATCH_SIZE = 500
+PROGRESS_SECONDS = 5
+FLUSH_EVERY = 1000  # Wait for the network thread every N messages so memory stays bounded
+
+# Stored metadata that is not part of what a device publishes
+METADATA_FIELDS = {"_id", "topic", "received_at"}
+
+
+def to_payload(doc):
+    """Turn a stored reading back into the payload a device would publish"""
+    payload = {k: v for k, v in doc.items() if k not in METADATA_FIELDS}
+    payload["timestamp"] = int(payload["timestamp"])
+    return payload
+
+
+# --- Sources: each yields (timestamp, device_id, payload) in timestamp order per device ---
+def mongo_device_readings(collection, device_id, start, end):
+    """Readings of one device, fetched a page at a time
+
+    Each page is a fresh query that resumes after the last (timestamp, _id) seen, so no
+    server-side cursor stays open while the replay waits for this device's next reading
+    (idle cursors are killed by MongoDB after 10 minutes).
+    """
+    query = {"device_id": device_id, "timestamp": {"$gte": start, "$lt": end}}
+    while True:
+        page = list(collection.find(query).sort([("timestamp", 1), ("_id", 1)]).limit(CURSOR_BATCH_SIZE))
+        for doc in page:
+            yield int(doc["timestamp"]), device_id, to_payload(doc)
+        if len(page) < CURSOR_BATCH_SIZE:
+            return
+        last = page[-1]
+        query = {
+            "device_id": device_id,
+            "timestamp": {"$lt": end},
+            "$or": [
+                {"timestamp": {"$gt": last["timestamp"]}},
+                {"timestamp": last["timestamp"], "_id": {"$gt": last["_id"]}},
+            ],
+        }
+
+
+def mongo_sources(collection, start, end, devices=None):
+    devices = devices or sorted(collection.distinct("device_id", {"timestamp": {"$gte": start, "$lt": end}}))
+    return [mongo_device_readings(collection, device_id, start, end) for device_id in devices]
+
+
+def archive_device_readings(device_dir, device_id, start, end):
+    """Rows of one device, a day at a time
+
+    A day can be spread over several part files (one per retention run), so the parts
+    are merged, de-duplicated on _id and sorted before the day is replayed.
+    """
+    import pyarrow.parquet as pq
+
+    for day_dir in sorted(device_dir.glob("date=*")):
+        rows = {}
+        for path in sorted(day_dir.glob("*.parquet")):
+            for row in pq.read_table(path).to_pylist():
+                if start <= row["timestamp"] < end:
+                    rows[row["_id"]] = row
+
+        for row in sorted(rows.values(), key=lambda r: r["timestamp"]):
+            payload = {
+                "device_id": device_id,
+                "timestamp": row["timestamp"],
+                "sensors": {k: row[k] for k in ("skintemp", "eda", "ppg") if row[k] is not None},
+            }
+            ppg = payload["sensors"].get("ppg")
+            if ppg and all(float(v).is_integer() for v in ppg):
+                # The archive stores PPG as float64, devices send integer counts
+                payload["sensors"]["ppg"] = [int(v) for v in ppg]
+            extra = json.loads(row["extra"]) if row["extra"] else {}
+            payload["sensors"].update(extra.pop("sensors", {}))
+            payload.update(extra)
+            yield row["timestamp"], device_id, payload
+
+
+def archive_sources(archive_dir, start, end, devices=None):
+    sources = []
+    for device_dir in sorted(Path(archive_dir).glob("device_id=*")):
+        device_id = device_dir.name.split("=", 1)[1]
+        if devices and device_id not in devices:
+            continue
+        sources.append(archive_device_readings(device_dir, device_id, start, end))
+    return sources
+
+
+def _plain(value):
+    """Unwrap mongoexport extended JSON ({"$numberLong": "1"}, {"$oid": ...})"""
+    if isinstance(value, dict) and len(value) == 1:
+        key, inner = next(iter(value.items()))
+        if key in ("$numberLong", "$numberInt", "$numberDouble"):
+            return float(inner) if key == "$numberDouble" else int(inner)
+        if key.startswith("$"):
+            return inner
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def jsonl_sources(path, start, end, devices=None):
+    """Readings of a JSONL file, loaded and sorted per device (export order is not guaranteed)"""
+    by_device = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            doc = _plain(json.loads(line))
+            device_id = doc.get("device_id")
+            if not device_id or (devices and device_id not in devices):
+                continue
+            if start <= int(doc["timestamp"]) < end:
+                by_device.setdefault(device_id, []).append((int(doc["timestamp"]), device_id, to_payload(doc)))
+    return [sorted(readings, key=lambda r: r[0]) for _, readings in sorted(by_device.items())]
+
+
+# --- Replay ---
+class Replayer:
+    def __init__(self, broker=REPLAY_BROKER_HOST, port=REPLAY_BROKER_PORT, clients=1,
+                 topic_prefix=REPLAY_TOPIC_PREFIX, encoding="json", speed=1.0, retime=False, qos=0):
+        """Initialize the replayer
+
+        Args:
+            broker (str): Broker host
+            port (int): Broker port
+            clients (int): MQTT connections to spread the devices over
+            topic_prefix (str): Readings go to <topic_prefix>/<device_id>
+            encoding (str): Payload encoding, see payload_codec.ENCODINGS
+            speed (float): 1 = real time, N = N times faster, 0 = as fast as possible
+            retime (bool): Shift timestamps so the first reading is stamped "now", only at speed 1
+            qos (int): MQTT QoS for every publish
+        """
+        if retime and speed != 1:
+            # Faster replays would stamp readings in the future and skew every time window
+            raise ValueError("retime is only supported at speed 1")
+        self.broker = broker
+        self.port = port
+        self.topic_prefix = topic_prefix
+        self.encoding = encoding
+        self.speed = speed
+        self.retime = retime
+        self.qos = qos
+        self.clients = [mqtt.Client() for _ in range(max(1, clients))]
+
+    def connect(self):
+        try:
+            for client in self.clients:
+                client.connect(self.broker, self.port, 60)
+                client.loop_start()
+            print(f"Connected {len(self.clients)} client(s) to {self.broker}:{self.port}")
+            return True
+        except Exception as e:
+            print(f"Error connecting to broker: {e}")
+            return False
+
+    def close(self):
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+    def client_for(self, device_id):
+        # Stable assignment so each device keeps its message order on one connection
+        return self.clients[zlib.crc32(device_id.encode()) % len(self.clients)]
+
+    def run(self, sources, limit=None):
+        """Publish the merged readings of all sources on the original timeline
+
+        Returns:
+            dict: Messages, bytes, devices, elapsed seconds and the largest lag behind schedule
+        """
+        stats = {"messages": 0, "bytes": 0, "devices": set(), "seconds": 0.0, "max_lag": 0.0}
+        pending = {}  # Client -> last MQTTMessageInfo
+        origin = wall_origin = None
+        started = last_report = time.perf_counter()
+
+        for timestamp, device_id, payload in heapq.merge(*sources, key=lambda reading: reading[0]):
+            if origin is None:
+                origin, wall_origin = timestamp, int(time.time())
+
+            if self.speed > 0:
+                delay = started + (timestamp - origin) / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    stats["max_lag"] = max(stats["max_lag"], -delay)
+
+            if self.retime:
+                payload["timestamp"] = wall_origin + (timestamp - origin)
+
+            encoded = encode_payload(payload, self.encoding)
+            client = self.client_for(device_id)
+            pending[client] = client.publish(f"{self.topic_prefix}/{device_id}", encoded, qos=self.qos)
+
+            stats["messages"] += 1
+            stats["bytes"] += len(encoded)
+            stats["devices"].add(device_id)
+
+            if stats["messages"] % FLUSH_EVERY == 0:
+                for info in pending.values():
+                    info.wait_for_publish(timeout=10)
+                pending.clear()
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_SECONDS:
+                print(f"Replayed {stats['messages']} messages from {len(stats['devices'])} device(s), "
+                      f"{stats['messages'] / (now - started):,.0f} msg/s, "
+                      f"lag {stats['max_lag']:.2f}s, at {datetime.fromtimestamp(timestamp).isoformat()}")
+                last_report = now
+
+            if limit and stats["messages"] >= limit:
+                break
+
+        for info in pending.values():
+            info.wait_for_publish(timeout=10)
+
+        stats["seconds"] = time.perf_counter() - started
+        stats["devices"] = len(stats["devices"])
+        return stats
+
+
+def parse_time(value):
+    """Accept a unix timestamp or an ISO date/datetime"""
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded sensor readings to an MQTT broker")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--archive", help="Parquet archive directory written by retention.py")
+    source.add_argument("--jsonl", help="JSONL file with one sensor_readings document per line")
+    parser.add_argument("--start", default="0", help="Unix timestamp or ISO date (inclusive)")
+    parser.add_argument("--end", default=str(int(time.time())), help="Unix timestamp or ISO date (exclusive)")
+    parser.add_argument("--devices", nargs="*", help="Device IDs (default: all devices in range)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = max")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json")
+    parser.add_argument("--retime", action="store_true", help="Stamp readings relative to now (speed 1 only)")
+    parser.add_argument("--broker", default=REPLAY_BROKER_HOST)
+    parser.add_argument("--port", type=int, default=REPLAY_BROKER_PORT)
+    parser.add_argument("--topic-prefix", default=REPLAY_TOPIC_PREFIX)
+    parser.add_argument("--clients", type=int, default=1, help="MQTT connections to spread devices over")
+    parser.add_argument("--qos", type=int, choices=(0, 1, 2), default=0)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after N messages")
+    args = parser.parse_args()
+
+    if args.retime and args.speed != 1:
+        parser.error("--retime is only supported with --speed 1")
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    db = None
+    if args.archive:
+        sources = archive_sources(args.archive, start, end, args.devices)
+    elif args.jsonl:
+        sources = jsonl_sources(args.jsonl, start, end, args.devices)
+    else:
+        from database import EmotiBitDatabase
+
+        db = EmotiBitDatabase()
+        if not db.connect():
+            raise SystemExit("Failed to connect to database, exiting.")
+        sources = mongo_sources(db.collection, start, end, args.devices)
+
+    replayer = Replayer(args.broker, args.port, args.clients, args.topic_prefix,
+                        args.encoding, args.speed, args.retime, args.qos)
+    if not replayer.connect():
+        raise SystemExit(1)
+
+    try:
+        stats = replayer.run(sources, args.limit)
+        print(f"Replay finished: {stats['messages']} messages ({stats['bytes']:,} bytes) from {stats['devices']} "
+              f"device(s) in {stats['seconds']:.1f}s ({stats['messages'] / stats['seconds'] if stats['seconds'] else 0:,.0f} msg/s), "
+              f"max lag {stats['max_lag']:.2f}s")
+    except KeyboardInterrupt:
+        print("Stopping replay...")
+    finally:
+        replayer.close()
+        if db:
+            db.close()
@@ -0,0 +1,265 @@
+# Retention job: archive aged sensor readings to Parquet and remove them from MongoDB
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pymongo
+from pymongo import DeleteMany
+
+from database import EmotiBitDatabase
+
+# Defaults (can be overridden with environment variables or CLI flags)
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '30'))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', './archive')
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '5000'))
+DELETE_BATCH_PARTITIONS = int(os.getenv('RETENTION_DELETE_BATCH', '20'))  # Partitions per bulk delete
+DELETE_MAX_TIME_MS = int(os.getenv('RETENTION_DELETE_MAX_TIME_MS', '300000'))  # Server-side limit per bulk delete
+
+SECONDS_PER_DAY = 86400
+
+# Fields stored as dedicated columns, everything else goes into "extra" as JSON
+KNOWN_FIELDS = {"_id", "device_id", "timestamp", "received_at", "topic", "sensors"}
+KNOWN_SENSORS = {"skintemp", "eda", "ppg"}
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("device_id", pa.string()),
+    ("timestamp", pa.int64()),
+    ("received_at", pa.timestamp("ms")),
+    ("topic", pa.string()),
+    ("skintemp", pa.float64()),
+    ("eda", pa.list_(pa.float64())),
+    ("ppg", pa.list_(pa.float64())),
+    ("extra", pa.string()),
+])
+
+
+class PartitionWriter:
+    """Buffers the documents of one device/day partition and writes them to a Parquet file"""
+
+    def __init__(self, archive_dir, device_id, day_start, run_id, batch_size=ARCHIVE_BATCH_SIZE):
+        self.device_id = device_id
+        self.day_start = day_start
+        self.batch_size = batch_size
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.rows_written = 0
+
+        day = datetime.fromtimestamp(day_start, tz=timezone.utc).strftime("%Y-%m-%d")
+        partition_dir = Path(archive_dir) / f"device_id={device_id}" / f"date={day}"
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        self.path = partition_dir / f"part-{run_id}.parquet"
+
+        self._rows = {name: [] for name in ARCHIVE_SCHEMA.names}
+        self._writer = pq.ParquetWriter(self.path, ARCHIVE_SCHEMA, compression="zstd")
+
+    def add(self, doc):
+        """Add one sensor_readings document to the partition"""
+        sensors = doc.get("sensors") or {}
+        extra = {k: v for k, v in doc.items() if k not in KNOWN_FIELDS}
+        extra_sensors = {k: v for k, v in sensors.items() if k not in KNOWN_SENSORS}
+        if extra_sensors:
+            extra["sensors"] = extra_sensors
+
+        timestamp = int(doc["timestamp"])
+        self._rows["_id"].append(str(doc["_id"]))
+        self._rows["device_id"].append(self.device_id)
+        self._rows["timestamp"].append(timestamp)
+        self._rows["received_at"].append(doc.get("received_at"))
+        self._rows["topic"].append(doc.get("topic"))
+        self._rows["skintemp"].append(sensors.get("skintemp"))
+        self._rows["eda"].append(sensors.get("eda"))
+        self._rows["ppg"].append(sensors.get("ppg"))
+        self._rows["extra"].append(json.dumps(extra, default=str) if extra else None)
+
+        if self.min_timestamp is None or timestamp < self.min_timestamp:
+            self.min_timestamp = timestamp
+        if self.max_timestamp is None or timestamp > self.max_timestamp:
+            self.max_timestamp = timestamp
+
+        if len(self._rows["_id"]) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows["_id"]:
+            return
+        table = pa.Table.from_pydict(self._rows, schema=ARCHIVE_SCHEMA)
+        self._writer.write_table(table)
+        self.rows_written += table.num_rows
+        self._rows = {name: [] for name in ARCHIVE_SCHEMA.names}
+
+    def close(self):
+        """Flush remaining rows, close the file and return the row count stored in it"""
+        self._flush()
+        self._writer.close()
+        return pq.ParquetFile(self.path).metadata.num_rows
+
+
+class RetentionJob:
+    def __init__(self, db, archive_dir=ARCHIVE_DIR, retention_days=RETENTION_DAYS,
+                 batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+        """Initialize the retention job
+
+        Args:
+            db (EmotiBitDatabase): Connected database instance
+            archive_dir (str): Root directory for the Parquet archive
+            retention_days (int): Documents older than this are archived
+            batch_size (int): Cursor batch size and rows per Parquet row group
+            dry_run (bool): Write and verify archives in a scratch directory, delete nothing
+        """
+        self.db = db
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    def run(self):
+        """Archive every document older than the retention window
+
+        Returns:
+            dict: Summary with archived, deleted and failed partition counts
+        """
+        if not self.db.connected:
+            print("Database not connected")
+            return None
+
+        if self.dry_run:
+            # Verify into a scratch directory so dry runs never add files to the real archive
+            scratch = tempfile.mkdtemp(prefix="retention-dry-run-")
+            try:
+                return self._archive(scratch)
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+        return self._archive(self.archive_dir)
+
+    def _archive(self, archive_dir):
+        cutoff = int(time.time()) - self.retention_days * SECONDS_PER_DAY
+        run_id = int(time.time())
+        print(f"Archiving readings older than {datetime.fromtimestamp(cutoff)} to {archive_dir}")
+
+        # Sorting on (device_id, timestamp) follows the compound index, so each
+        # device/day partition arrives contiguously and only one file is open at a time
+        cursor = self.db.collection.find(
+            {"timestamp": {"$lt": cutoff}},
+            no_cursor_timeout=True,
+        ).sort([("device_id", 1), ("timestamp", 1)]).batch_size(self.batch_size)
+
+        verified = []
+        failed = []
+        writer = None
+        try:
+            for doc in cursor:
+                device_id = doc.get("device_id")
+                if device_id is None or doc.get("timestamp") is None:
+                    continue
+                day_start = int(doc["timestamp"]) // SECONDS_PER_DAY * SECONDS_PER_DAY
+
+                if writer is None or writer.device_id != device_id or writer.day_start != day_start:
+                    if writer is not None:
+                        self._finish_partition(writer, cutoff, verified, failed)
+                    writer = PartitionWriter(archive_dir, device_id, day_start, run_id, self.batch_size)
+
+                writer.add(doc)
+
+            if writer is not None:
+                self._finish_partition(writer, cutoff, verified, failed)
+        finally:
+            cursor.close()
+
+        deleted = self._delete_archived(verified, cutoff)
+        summary = {
+            "partitions": len(verified),
+            "failed_partitions": len(failed),
+            "archived": sum(w.rows_written for w in verified),
+            "deleted": deleted,
+        }
+        print(f"Retention finished: {summary}")
+        return summary
+
+    def _finish_partition(self, writer, cutoff, verified, failed):
+        """Close a partition and check the file against MongoDB before it may be deleted"""
+        try:
+            file_rows = writer.close()
+            db_rows = self.db.collection.count_documents(self._partition_filter(writer, cutoff))
+        except Exception as e:
+            print(f"Error verifying archive {writer.path}: {e}")
+            self._discard(writer)
+            failed.append(writer)
+            return
+
+        if file_rows == writer.rows_written == db_rows:
+            print(f"Archived {file_rows} readings to {writer.path}")
+            verified.append(writer)
+        else:
+            print(f"Row count mismatch for {writer.path} (file={file_rows}, "
+                  f"written={writer.rows_written}, db={db_rows}); keeping documents")
+            self._discard(writer)
+            failed.append(writer)
+
+    def _discard(self, writer):
+        """Remove the file of a partition that stays in MongoDB, so the next run does not archive it twice"""
+        try:
+            writer.path.unlink(missing_ok=True)
+        except Exception as e:
+            print(f"Error removing {writer.path}: {e}")
+
+    def _partition_filter(self, writer, cutoff):
+        return {
+            "device_id": writer.device_id,
+            "timestamp": {
+                "$gte": writer.day_start,
+                "$lt": min(writer.day_start + SECONDS_PER_DAY, cutoff),
+            },
+        }
+
+    def _delete_archived(self, verified, cutoff):
+        """Delete the verified partition ranges a few partitions at a time
+
+        A failed delete may still have removed documents on the server (a client
+        timeout does not stop it), so the archive files are always kept. Replaying
+        the archive de-duplicates parts on _id.
+        """
+        if self.dry_run or not verified:
+            return 0
+
+        deleted = 0
+        for i in range(0, len(verified), DELETE_BATCH_PARTITIONS):
+            chunk = verified[i:i + DELETE_BATCH_PARTITIONS]
+            requests = [DeleteMany(self._partition_filter(w, cutoff)) for w in chunk]
+            try:
+                # Sends maxTimeMS so the server stops the delete instead of outliving the client
+                with pymongo.timeout(DELETE_MAX_TIME_MS / 1000):
+                    result = self.db.collection.bulk_write(requests, ordered=False)
+                deleted += result.deleted_count
+            except Exception as e:
+                print(f"Error deleting archived readings: {e}")
+                for writer in chunk:
+                    print(f"Keeping {writer.path}, its readings may be partly deleted")
+        return deleted
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old sensor readings to Parquet")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Retention window in days")
+    parser.add_argument("--out", default=ARCHIVE_DIR, help="Archive root directory")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Archive and verify without deleting")
+    args = parser.parse_args()
+
+    # Long cursors and bulk deletes must not be cut off by the service-wide socket timeout,
+    # the deletes are bounded server-side with maxTimeMS instead
+    os.environ['MONGO_SOCKET_TIMEOUT_MS'] = '0'
+    db = EmotiBitDatabase()
+    if db.connect():
+        try:
+            RetentionJob(db, args.out, args.days, args.batch_size, args.dry_run).run()
+        finally:
+            db.close()
+    else:
+        print("Failed to connect to database, exiting.")
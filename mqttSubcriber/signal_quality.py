@@ -0,0 +1,92 @@
+# Signal quality gate for the feature stage: cheap NumPy checks that keep flat,
+# clipped or pulseless windows away from neurokit2 and out of preprocessed_data.
+# The classification API carries the same checks in preprocess/preprocess.py, both
+# read the same environment variables so the gate is tuned in one place.
+import os
+
+import numpy as np
+
+PPG_SAMPLING_RATE = 100
+EDA_SAMPLING_RATE = 15
+
+QUALITY_GATE_ENABLED = os.getenv('QUALITY_GATE_ENABLED', 'true').lower() == 'true'
+QUALITY_MIN_COVERAGE = float(os.getenv('QUALITY_MIN_COVERAGE', '0.8'))  # share of expected samples
+QUALITY_MAX_SATURATION = float(os.getenv('QUALITY_MAX_SATURATION', '0.05'))  # share pinned at min/max
+QUALITY_MIN_PULSE_POWER = float(os.getenv('QUALITY_MIN_PULSE_POWER', '0.5'))  # share of 0.1-8 Hz power
+PULSE_BAND = (0.7, 3.5)  # Hz, 42-210 bpm
+SPECTRUM_BAND = (0.1, 8.0)  # Hz
+
+
+class SignalQualityError(Exception):
+    """Raised when a window is not worth running through neurokit2"""
+
+    def __init__(self, reason, metrics):
+        super().__init__(reason, metrics)
+        self.reason = reason
+        self.metrics = metrics
+
+    def __str__(self):
+        return f"signal quality check failed: {self.reason}"
+
+
+def _channel_quality(name, signal, expected):
+    """Coverage, flatline and saturation checks for one channel, returns (reason, metrics)"""
+    values = np.asarray(signal, dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    coverage = float(finite.size / expected) if expected else 0.0
+    metrics = {f"{name}_coverage": round(coverage, 3)}
+
+    if coverage < QUALITY_MIN_COVERAGE:
+        return f"{name}_low_coverage", metrics
+
+    low, high = finite.min(), finite.max()
+    std = finite.std()
+    metrics[f"{name}_std"] = float(std)
+    if high == low or std <= 1e-9 * max(1.0, abs(finite.mean())):
+        return f"{name}_flatline", metrics
+
+    saturation = float(np.count_nonzero((finite == low) | (finite == high)) / finite.size)
+    metrics[f"{name}_saturation"] = round(saturation, 3)
+    if saturation > QUALITY_MAX_SATURATION:
+        return f"{name}_saturated", metrics
+
+    return None, metrics
+
+
+def _pulse_band_power(ppg, sampling_rate=PPG_SAMPLING_RATE):
+    """Share of the 0.1-8 Hz power that falls into the pulse band"""
+    values = np.asarray(ppg, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    values = values - values.mean()
+    power = np.abs(np.fft.rfft(values * np.hanning(values.size))) ** 2
+    freqs = np.fft.rfftfreq(values.size, d=1.0 / sampling_rate)
+
+    total = power[(freqs >= SPECTRUM_BAND[0]) & (freqs <= SPECTRUM_BAND[1])].sum()
+    pulse = power[(freqs >= PULSE_BAND[0]) & (freqs <= PULSE_BAND[1])].sum()
+    return float(pulse / total) if total > 0 else 0.0
+
+
+def check_signal_quality(ppg, eda, window_seconds):
+    """Decide whether a window is usable
+
+    Args:
+        ppg (array-like): PPG samples at PPG_SAMPLING_RATE
+        eda (array-like): EDA samples at EDA_SAMPLING_RATE
+        window_seconds (int): Time span the samples should cover
+
+    Returns:
+        tuple: (reason code or None when usable, metrics dict)
+    """
+    metrics = {}
+    for name, signal, rate in (("ppg", ppg, PPG_SAMPLING_RATE), ("eda", eda, EDA_SAMPLING_RATE)):
+        reason, channel_metrics = _channel_quality(name, signal, rate * window_seconds)
+        metrics.update(channel_metrics)
+        if reason:
+            return reason, metrics
+
+    pulse_power = _pulse_band_power(ppg)
+    metrics["ppg_pulse_power"] = round(pulse_power, 3)
+    if pulse_power < QUALITY_MIN_PULSE_POWER:
+        return "ppg_no_pulse", metrics
+
+    return None, metrics
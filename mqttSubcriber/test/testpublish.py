@@ -1,8 +1,14 @@
 import paho.mqtt.client as mqtt
+import os
+import sys
 import time
 import random
 import json
 
+# Reuse the subscriber's encoders so both sides agree on the wire format
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from payload_codec import ENCODINGS, encode_payload
+
 # Broker configuration
 broker_address = "broker.emqx.io"
 port = 1883
@@ -11,6 +17,11 @@ keep_alive = 60
 # Topic to publish to
 base_topic = "Emotibit"
 
+# Payload encoding: json, msgpack, cbor, zlib, zstd or packed
+payload_encoding = os.getenv("PAYLOAD_ENCODING", "json")
+if payload_encoding not in ENCODINGS:
+    raise SystemExit(f"Unknown PAYLOAD_ENCODING {payload_encoding!r}, expected one of {ENCODINGS}")
+
 class EmotibitData:
     def __init__(self):
         self.device_id = "Emotibit-001"  # Default device ID
@@ -42,13 +53,18 @@ class EmotibitData:
             
         self.timestamp = int(time.time())
     
-    def to_json(self):
-        data = {
+    def to_dict(self):
+        return {
             "device_id": self.device_id,
             "timestamp": self.timestamp,
             "sensors": self.sensors
         }
-        return json.dumps(data)
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def encode(self, encoding="json"):
+        return encode_payload(self.to_dict(), encoding)
     
     def publish_data(self, client):
         """Generate and publish data to MQTT broker"""
@@ -56,8 +72,13 @@ class EmotibitData:
         
         # Publish all data to the device topic
         device_topic = f"{base_topic}/{self.device_id}"
-        client.publish(device_topic, self.to_json())
-        print(f"Published to {device_topic} - PPG: {len(self.sensors['ppg'])} samples @ 100Hz, EDA: {len(self.sensors['eda'])} samples")
+        started = time.perf_counter()
+        payload = self.encode(payload_encoding)
+        encode_us = (time.perf_counter() - started) * 1e6
+        client.publish(device_topic, payload)
+        json_size = len(self.to_json())
+        print(f"Published to {device_topic} - PPG: {len(self.sensors['ppg'])} samples @ 100Hz, EDA: {len(self.sensors['eda'])} samples, "
+              f"{payload_encoding}: {len(payload)} bytes ({len(payload) / json_size:.0%} of JSON), encoded in {encode_us:.0f} µs")
     
 # Callback functions
 def on_connect(client, userdata, flags, rc):